@@ -5,6 +5,8 @@ import random
 from src.ga.plan import *
 import src.ga.ga_engine as ga_engine
 from src.ai_agent.llm import LLM
+from src.ai_agent.cache import ResponseCache
+from src.flightSimulator import european_cities
 import src.ai_agent.prompt as prompt
 from src.visual import plotBestInviduals
 import boto3
@@ -49,11 +51,22 @@ def configureLLM():
         region_name=os.getenv("AWS_REGION")
         )
 
+    # exact resubmissions skip Bedrock; LLM_CACHE_SIMILARITY also matches rewordings with the same facts
+    similarity = os.getenv("LLM_CACHE_SIMILARITY")
+    cache = ResponseCache(
+        path=os.getenv("LLM_CACHE_PATH", "llm_cache.json"),
+        ttl=float(os.getenv("LLM_CACHE_TTL", 24 * 3600)),
+        similarityThreshold=float(similarity) if similarity else None,
+        templates=(prompt.tripBuilder.user,),
+        names=tuple(european_cities)
+    )
+
     llm = LLM(
         endpoint_id="eu.anthropic.claude-3-7-sonnet-20250219-v1:0",
         boto3_session=session,
         region=os.getenv("AWS_REGION"),
-        version="bedrock-2023-05-31"
+        version="bedrock-2023-05-31",
+        cache=cache
     )
     return llm
 
@@ -100,13 +113,13 @@ def main():
     print(bestIndividual)
 
     print(f"\nChosen destination: {bestIndividual.chosenDestination}\n")
-    for i, traveller in enumerate(bestIndividual.travellers):
+    for i, (traveller, route) in enumerate(zip(bestIndividual.travellers, bestIndividual.selectedRoutes())):
         print(f"Traveller {i+1}:")
         print(f"  Origin: {traveller.origin}")
         print(f"  Budget: €{traveller.budget:.2f}")
-        if traveller.selectedRoute:
-            to = traveller.selectedRoute.flightToGo
-            back = traveller.selectedRoute.flightBack
+        if route:
+            to = route.flightToGo
+            back = route.flightBack
             print("  Outbound Flight:")
             print(f"    {to.from_city} → {to.to_city}")
             print(f"    Date: {to.departure_date} | Departure: {to.departure_time_local.time()} | Arrival: {to.arrival_time_local.time()}")
@@ -115,6 +128,6 @@ def main():
             print(f"    {back.from_city} → {back.to_city}")
             print(f"    Date: {back.departure_date} | Departure: {back.departure_time_local.time()} | Arrival: {back.arrival_time_local.time()}")
             print(f"    Price: €{back.price_eur:.2f} | Stayovers: {back.stayovers} | Flight: {back.flight_number} | Duration: {back.duration_hours}h")
-            print(f"  Total Route Cost: €{traveller.selectedRoute.cost:.2f}\n")
+            print(f"  Total Route Cost: €{route.cost:.2f}\n")
 if __name__ == '__main__':
     main()
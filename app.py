@@ -1,7 +1,7 @@
 from fastapi import FastAPI, Request, Form
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi import WebSocket, WebSocketDisconnect
 import uvicorn
@@ -11,18 +11,102 @@ import random
 import src.ai_agent.prompt as prompt
 import json
 from src.ga.ga_engine import GeneticAlgorithm, run_ga_generator
+from src.ga.stopping import StoppingCriteria
+from src.ga.islands import IslandModel
+from src.ga.exact import ExactSolver
+from src.scheduler import PlanningScheduler, SchedulerBusy
+from src.ga.cache import PlanCache
+from src.ga.seeders import PreviousSolutionsSeeder, CheapestSeeder, AlignedArrivalSeeder
+from src.metrics import REGISTRY
+from contextlib import aclosing
 import asyncio
+import os
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
 
 random.seed(50)
 DB = "flightsAPI"
-flightEngine = FlightEngine(DB)
+flightEngine = FlightEngine(DB, backend=os.getenv("FLIGHT_BACKEND", "sql")) # "columnar" keeps the flights in memory
 
 llm = configureLLM()
 
 history = []
+PARTIAL_PREFIX = "[PARTIAL]" # streamed text, the UI appends it to the message being written
+# latency SLA of a planning request, and no CPU wasted on converged runs
+PLAN_TIME_BUDGET = float(os.getenv("PLAN_TIME_BUDGET", 30))
+STAGNATION_GENERATIONS = int(os.getenv("STAGNATION_GENERATIONS", 10))
+PLAN_ENGINE = os.getenv("PLAN_ENGINE", "ga") # "ga", "islands" or "exact"
+PLAN_ISLANDS = int(os.getenv("PLAN_ISLANDS", os.cpu_count() or 1))
+SEED_FRACTION = float(os.getenv("SEED_FRACTION", 0.2)) # share of the initial population built by the seeders
+
+# planning runs share the cores: a few run at once, the rest queue, and beyond the queue we say so.
+# GA and exact runs are threads sharing the GIL, one core does them all; an island run holds a core per island
+PLAN_WEIGHT = PLAN_ISLANDS if PLAN_ENGINE == "islands" else 1
+scheduler = PlanningScheduler(
+    workers=int(os.getenv("PLANNER_WORKERS", (os.cpu_count() or 1) if PLAN_ENGINE == "islands" else 1)),
+    maxQueued=int(os.getenv("PLANNER_QUEUE", 32))
+)
+BUSY_MESSAGE = "All our planners are busy right now, please try again in a few minutes."
+
+# best plan per request and flights dataset version: repeated requests are answered at once
+planCache = PlanCache(maxSize=int(os.getenv("PLAN_CACHE_SIZE", 256)))
+
+def createPlanner(planCreated, similarResults=None):
+    """ Every engine yields progress updates and ends with the suggested trip plan.
+    similarResults: results of similar plans the GA engines start from """
+    if PLAN_ENGINE == "exact":
+        return ExactSolver(
+            travellersTemplate=planCreated.listTravellers,
+            travelPlan=planCreated.travelPlan,
+            flightEngine=flightEngine,
+            timeBudget=PLAN_TIME_BUDGET
+        )
+
+    stopping = StoppingCriteria(
+        stagnationGenerations=STAGNATION_GENERATIONS,
+        timeBudget=PLAN_TIME_BUDGET
+    )
+    seeders = [PreviousSolutionsSeeder(similarResults or []), AlignedArrivalSeeder(), CheapestSeeder()]
+    if PLAN_ENGINE == "islands":
+        return IslandModel(
+            travellersTemplate=planCreated.listTravellers,
+            travelPlan=planCreated.travelPlan,
+            flightEngine=flightEngine,
+            islands=PLAN_ISLANDS,
+            stopping=stopping,
+            seeders=seeders,
+            seedFraction=SEED_FRACTION
+        )
+    if PLAN_ENGINE == "ga":
+        return GeneticAlgorithm(
+            travellersTemplate=planCreated.listTravellers,
+            travelPlan=planCreated.travelPlan,
+            flightEngine=flightEngine,
+            stopping=stopping,
+            seeders=seeders,
+            seedFraction=SEED_FRACTION
+        )
+    raise ValueError(f"Unknown plan engine: {PLAN_ENGINE}")
+
+async def watchDisconnect(websocket: WebSocket, onDisconnect):
+    """ Reacts as soon as the client goes away, instead of at the next failed send """
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    except Exception:
+        pass
+    onDisconnect()
+
+@app.get("/scheduler")
+async def schedulerStats():
+    """ Queue depth, running plans and wait times of the planning scheduler """
+    return scheduler.stats()
+
+@app.get("/metrics")
+async def metrics():
+    """ Prometheus scrape endpoint: LLM, flight queries, route building, GA, caches and scheduler """
+    return PlainTextResponse(REGISTRY.exposition(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def getUI(request: Request):
@@ -37,28 +121,75 @@ async def websocketPlanTrip(websocket: WebSocket):
         data = await websocket.receive_text()
         userQuery = json.loads(data).get("userQuery")
 
-        responseAgent = llm.generateTrip(
-            prompt.tripBuilder.system,
-            prompt.tripBuilder.user + userQuery
-        )
+        # the agent's answer is forwarded while it streams in, the plan is parsed once complete
+        responseAgent = None
+        streamed = False
+        try:
+            # closed right away if the client leaves mid-answer: the Bedrock stream stops with it
+            async with aclosing(llm.astreamTrip(prompt.tripBuilder.system, prompt.tripBuilder.user + userQuery)) as answer:
+                async for kind, payload in answer:
+                    if kind == "text":
+                        await websocket.send_text(PARTIAL_PREFIX + payload)
+                        streamed = True
+                    else:
+                        responseAgent = payload
+        except asyncio.TimeoutError:
+            await websocket.send_text("The agent is taking too long to answer, please try again in a moment.")
+            await websocket.close()
+            return
+
         if isinstance(responseAgent, dict):
             if "missingInformation" in responseAgent.keys():
                 await websocket.send_text(responseAgent["missingInformation"])
             else:
                 planCreated = buildPlan(responseAgent)
+                travellers, travelPlan = planCreated.listTravellers, planCreated.travelPlan
+                datasetVersion = await flightEngine.adatasetVersion()
+                cached = planCache.getResult(travellers, travelPlan, datasetVersion)
+                if cached is not None:
+                    await websocket.send_text(cached.message)
+                    await websocket.send_text("[DONE]")
+                    await websocket.close()
+                    return
 
-                gaEngine = GeneticAlgorithm(
-                    travellersTemplate=planCreated.listTravellers,
-                    travelPlan=planCreated.travelPlan,
-                    flightEngine=flightEngine
-                )
-                async for updateProgress in run_ga_generator(gaEngine):
-                    await websocket.send_text(updateProgress)
-                    if "This is my suggested trip plan:" in updateProgress:
-                        await websocket.send_text("[DONE]")
-        else:
+                try:
+                    ticket = scheduler.submit(weight=PLAN_WEIGHT)
+                except SchedulerBusy:
+                    await websocket.send_text(BUSY_MESSAGE)
+                    await websocket.close()
+                    return
+
+                gaEngine = None
+                def onDisconnect():
+                    if not ticket.granted:
+                        ticket.release() # gives up its place in the queue
+                    if gaEngine is not None:
+                        gaEngine.cancelled.set()
+
+                # the client sends nothing while planning: the next message is the disconnect
+                watcher = asyncio.create_task(watchDisconnect(websocket, onDisconnect))
+                try:
+                    async for position in ticket.waitTurn():
+                        await websocket.send_text(f"All planners are busy, you are number {position} in the queue.")
+                    if ticket.released:
+                        return
+
+                    gaEngine = createPlanner(planCreated, planCache.similar(travellers, travelPlan, datasetVersion))
+                    if not isinstance(gaEngine, IslandModel): # islands build their routes in their own processes
+                        # route tables come from the shared async connection pool, off the event loop
+                        await gaEngine.aprefetch_routes()
+                    async with aclosing(run_ga_generator(gaEngine, scheduler.executor)) as updates:
+                        async for updateProgress in updates:
+                            await websocket.send_text(updateProgress)
+                            if "This is my suggested trip plan:" in updateProgress:
+                                await websocket.send_text("[DONE]")
+                                planCache.putTrip(travellers, travelPlan, datasetVersion, gaEngine.best, updateProgress)
+                finally:
+                    watcher.cancel()
+                    ticket.release()
+        elif not streamed: # a plain text answer is already on the page, as it streamed in
             await websocket.send_text(responseAgent)
-        
+
         await websocket.close()
         return
 
@@ -0,0 +1,261 @@
+""" Reproducible benchmark of the planning pipeline on a seeded synthetic database.
+Covers retrieveFlights by query shape, createRoutes, create_individual, evaluate_individual,
+full GeneticAlgorithm runs and generations to a target fitness with and without seeders.
+Results go to JSON; pass a previous file as --baseline to fail on regressions.
+Benchmarks a small database cannot feed (no destination served for every traveller) are recorded as skipped.
+Usage: python benchmark.py [--rows 200000] [--seed 50] [--backend sql] [--quick]
+                           [--output benchmark.json] [--baseline old.json] [--threshold 0.2] """
+
+from src.flightSimulator import simulate
+from src.flightSearcher import FlightEngine
+from src.flight import FlightSelection
+from src.ga.plan import Traveller, TravelPlan
+from src.ga.ga_engine import GeneticAlgorithm
+from src.ga.evaluation import evaluatePopulation
+from src.ga.seeders import CheapestSeeder, AlignedArrivalSeeder
+from deap import tools
+from datetime import date, timedelta
+import statistics
+import itertools
+import platform
+import argparse
+import random
+import json
+import time
+import sys
+import os
+
+# fixed dates: prices depend on the day the dataset is generated
+START = date(2026, 1, 1)
+DAYS = 180
+ORIGINS = ["Malaga", "Valencia", "Berlin", "Lisbon", "Warsaw", "Dublin"]
+DESTINATIONS = ["Paris", "London", "Milan", "Barcelona", "Copenhagen", "Oslo", "Rome", "Prague"]
+BUDGETS = [500, 600, 450, 550, 400, 650]
+NO_FEASIBLE_DESTINATION = "no destination has flights for every traveller in this database"
+
+def buildDatabase(rows: int, seed: int, workers: int) -> str:
+    """ One database per (rows, seed), generated on first use and reused afterwards """
+    database = f"benchmark_{rows}_{seed}"
+    if not os.path.exists(f"{database}.db"):
+        t0 = time.perf_counter()
+        simulate(database=database, rows=rows, seed=seed, startDate=START, days=DAYS, today=START, workers=workers)
+        print(f"Generated {database}.db in {time.perf_counter() - t0:.1f}s")
+    return database
+
+def measure(fn, repeat: int) -> dict:
+    """ Wall time of repeated calls of fn, in milliseconds """
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+    return {
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min_ms": timings[0],
+        "repeat": repeat
+    }
+
+def skipped(reason: str) -> dict:
+    """ Result of a benchmark that could not run, kept in the JSON so runs stay comparable """
+    return {"skipped": reason}
+
+def travelPlan(destinations: int, window: int = 90) -> TravelPlan:
+    return TravelPlan(
+        fromDate=START + timedelta(days=30),
+        toDate=START + timedelta(days=30 + window),
+        priceMax=700,
+        days=5,
+        availableDestinations=DESTINATIONS[:destinations]
+    )
+
+def travellers(count: int) -> list[Traveller]:
+    return [Traveller(origin=origin, budget=budget) for origin, budget in zip(ORIGINS, BUDGETS)][:count]
+
+def benchRetrieveFlights(flightEngine: FlightEngine, repeat: int) -> dict:
+    window = (START + timedelta(days=30), START + timedelta(days=120))
+    shapes = {
+        "route": dict(startCity="Malaga", destinationCity="Paris", priceMax=700),
+        "route_direct": dict(startCity="Malaga", destinationCity="Paris", priceMax=700, stayoversAllowed=False),
+        "route_no_price": dict(startCity="Malaga", destinationCity="Paris"),
+        "origin_only": dict(startCity="Malaga", priceMax=700),
+        "origin_veto": dict(startCity="Malaga", priceMax=700, vetoDestinations=DESTINATIONS[:4]),
+        "route_one_week": dict(startCity="Malaga", destinationCity="Paris", priceMax=700, endDate=window[0] + timedelta(days=7)),
+    }
+    results = {}
+    for name, fields in shapes.items():
+        selection = FlightSelection(**{"startDate": window[0], "endDate": window[1], **fields})
+        result = measure(lambda: flightEngine.retrieveFlights(selection), repeat)
+        result["rows"] = len(flightEngine.retrieveFlights(selection))
+        results[f"retrieveFlights.{name}"] = result
+    return results
+
+def benchCreateRoutes(flightEngine: FlightEngine, repeat: int) -> dict:
+    plan = travelPlan(len(DESTINATIONS))
+    result = measure(lambda: plan.createRoutes("Malaga", "Paris", flightEngine), repeat)
+    result["routes"] = len(plan.createRoutes("Malaga", "Paris", flightEngine))
+    return {"createRoutes.per_traveller": result}
+
+def benchIndividuals(flightEngine: FlightEngine, repeat: int) -> dict:
+    random.seed(50)
+    plan = travelPlan(4)
+    group = travellers(4)
+    names = ["create_individual.cold", "create_individual.warm", "evaluate_individual.200", "evaluatePopulation.200"]
+    if not GeneticAlgorithm(group, plan, flightEngine).get_feasibility().feasibleDestinations:
+        return {name: skipped(NO_FEASIBLE_DESTINATION) for name in names}
+
+    # cold: a new engine every call, so routes are queried again
+    cold = measure(lambda: GeneticAlgorithm(group, plan, flightEngine).create_individual(flightEngine), repeat)
+    gaEngine = GeneticAlgorithm(group, plan, flightEngine)
+    gaEngine.create_individual(flightEngine)
+    warm = measure(lambda: gaEngine.create_individual(flightEngine), repeat * 10)
+
+    population = [individual for individual in (gaEngine.create_individual(flightEngine) for _ in range(200)) if individual]
+    scalar = measure(lambda: [gaEngine.evaluate_individual(individual) for individual in population], repeat)
+    batch = measure(lambda: evaluatePopulation(population, plan.days), repeat)
+    for result in (scalar, batch):
+        result["per_individual_us"] = result["median_ms"] * 1000 / len(population)
+
+    return dict(zip(names, (cold, warm, scalar, batch)))
+
+def benchRuns(flightEngine: FlightEngine, repeat: int, quick: bool) -> dict:
+    grid = {
+        "population": [10, 50] if quick else [10, 50, 200],
+        "generations": [5] if quick else [5, 20],
+        "travellers": [2, 4] if quick else [2, 4, 6],
+        "destinations": [4] if quick else [4, 8]
+    }
+    results = {}
+    for population, generations, count, destinations in itertools.product(*grid.values()):
+        plan = travelPlan(destinations)
+        group = travellers(count)
+        fitnesses = []
+
+        def run():
+            random.seed(50)
+            gaEngine = GeneticAlgorithm(group, plan, flightEngine, populationSize=population, ngen=generations)
+            for _ in gaEngine.run():
+                pass
+            fitnesses.append(gaEngine.best.fitness.values[0] if gaEngine.best else None)
+
+        result = measure(run, repeat)
+        result["best_fitness"] = fitnesses[-1]
+        name = f"run.pop{population}.gen{generations}.trav{count}.dest{destinations}"
+        results[name] = result if fitnesses[-1] is not None else skipped(NO_FEASIBLE_DESTINATION)
+    return results
+
+def benchSeeding(flightEngine: FlightEngine, repeat: int) -> dict:
+    """ Generations until the best fitness reaches the median final fitness of unseeded runs,
+    generation 0 being the initial population. None when a run never gets there """
+    plan = travelPlan(8)
+    group = travellers(4)
+    generations = 20
+    if not GeneticAlgorithm(group, plan, flightEngine).get_feasibility().feasibleDestinations:
+        return {"seeding.unseeded": skipped(NO_FEASIBLE_DESTINATION), "seeding.seeded": skipped(NO_FEASIBLE_DESTINATION)}
+    variants = {
+        "unseeded": {},
+        "seeded": {"seeders": [AlignedArrivalSeeder(), CheapestSeeder()], "seedFraction": 0.2}
+    }
+
+    curves = {name: [] for name in variants}
+    timings = {name: [] for name in variants}
+    for name, options in variants.items():
+        for run in range(repeat):
+            random.seed(run)
+            gaEngine = GeneticAlgorithm(group, plan, flightEngine, populationSize=50, ngen=generations, **options)
+            t0 = time.perf_counter()
+            population = gaEngine.initialize_population()
+            curve = [tools.selBest(population, 1)[0].fitness.values[0]]
+            for _ in range(generations):
+                population[:] = gaEngine.evolve(population)
+                curve.append(tools.selBest(population, 1)[0].fitness.values[0])
+            timings[name].append((time.perf_counter() - t0) * 1000)
+            curves[name].append(curve)
+
+    target = statistics.median(curve[-1] for curve in curves["unseeded"])
+    results = {}
+    for name, runs in curves.items():
+        reached = [next((gen for gen, fitness in enumerate(curve) if fitness <= target), None) for curve in runs]
+        results[f"seeding.{name}"] = {
+            "median_ms": statistics.median(timings[name]),
+            "p95_ms": max(timings[name]),
+            "min_ms": min(timings[name]),
+            "repeat": repeat,
+            "target_fitness": target,
+            "generations_to_target": reached,
+            "final_fitness_median": statistics.median(curve[-1] for curve in runs)
+        }
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """ Names of the benchmarks whose median got slower than the baseline by more than threshold """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous or "skipped" in previous or "skipped" in result:
+            continue
+        ratio = result["median_ms"] / previous["median_ms"] if previous["median_ms"] else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:55s} {previous['median_ms']:10.3f}ms -> {result['median_ms']:10.3f}ms  x{ratio:.2f}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=50)
+    parser.add_argument("--backend", default="sql", choices=["sql", "columnar"])
+    parser.add_argument("--workers", type=int, default=1, help="processes generating the database")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="smaller GeneticAlgorithm.run grid")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", default=None, help="previous results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="tolerated slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    database = buildDatabase(args.rows, args.seed, args.workers)
+    flightEngine = FlightEngine(database, backend=args.backend)
+
+    results = {}
+    for bench in (benchRetrieveFlights, benchCreateRoutes, benchIndividuals):
+        results.update(bench(flightEngine, args.repeat))
+    results.update(benchRuns(flightEngine, args.repeat, args.quick))
+    results.update(benchSeeding(flightEngine, args.repeat))
+
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:55s} skipped: {result['skipped']}")
+        else:
+            print(f"{name:55s} median {result['median_ms']:10.3f}ms | p95 {result['p95_ms']:10.3f}ms")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "meta": {
+                "rows": args.rows,
+                "seed": args.seed,
+                "backend": args.backend,
+                "repeat": args.repeat,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+            },
+            "results": results
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["rows"] != args.rows or baseline["meta"]["seed"] != args.seed:
+            print("Warning: the baseline was measured on a different database")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
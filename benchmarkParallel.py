@@ -0,0 +1,65 @@
+""" Serial vs parallel GeneticAlgorithm on this machine.
+Usage: python benchmarkParallel.py [--database flightsAPI] [--population 500] [--generations 10] [--processes N] """
+
+from src.flightSearcher import FlightEngine
+from src.ga.plan import Traveller, TravelPlan
+from src.ga.ga_engine import GeneticAlgorithm
+from src.ga.parallel import shutdownPools
+from datetime import date, timedelta
+import multiprocessing
+import argparse
+import random
+import time
+
+TRAVELLERS = [
+    Traveller(origin="Malaga", budget=500),
+    Traveller(origin="Valencia", budget=600),
+    Traveller(origin="Berlin", budget=450),
+    Traveller(origin="Lisbon", budget=550)
+]
+
+def timeRun(flightEngine, travelPlan, population, generations, parallel, processes=None) -> float:
+    random.seed(50)
+    gaEngine = GeneticAlgorithm(
+        travellersTemplate=TRAVELLERS,
+        travelPlan=travelPlan,
+        flightEngine=flightEngine,
+        populationSize=population,
+        ngen=generations,
+        parallel=parallel,
+        processes=processes
+    )
+    t0 = time.perf_counter()
+    for _ in gaEngine.run():
+        pass
+    return time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database", default="flightsAPI")
+    parser.add_argument("--population", type=int, default=500)
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    flightEngine = FlightEngine(args.database)
+    travelPlan = TravelPlan(
+        fromDate=date.today(),
+        toDate=date.today() + timedelta(days=120),
+        priceMax=700,
+        days=5,
+        availableDestinations=["Paris", "London", "Milan", "Warsaw", "Barcelona", "Copenhagen", "Oslo", "Rome"]
+    )
+
+    serial = timeRun(flightEngine, travelPlan, args.population, args.generations, parallel=False)
+    # first parallel run pays for spawning the workers, the second one shows the steady state
+    coldParallel = timeRun(flightEngine, travelPlan, args.population, args.generations, parallel=True, processes=args.processes)
+    warmParallel = timeRun(flightEngine, travelPlan, args.population, args.generations, parallel=True, processes=args.processes)
+    shutdownPools()
+
+    print(f"Serial: {serial:.3f}s")
+    print(f"Parallel ({args.processes} processes, cold pool): {coldParallel:.3f}s | speedup x{serial / coldParallel:.2f}")
+    print(f"Parallel ({args.processes} processes, warm pool): {warmParallel:.3f}s | speedup x{serial / warmParallel:.2f}")
+
+if __name__ == "__main__":
+    main()
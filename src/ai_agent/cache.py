@@ -0,0 +1,196 @@
+""" Response cache in front of LLM.invoke.
+Layer 1: exact key over the normalized system and user prompts.
+Layer 2 (optional): closest previous user query by cosine similarity of character n-grams.
+Only the user's own query is compared, without the constant prompt template, and only against queries
+repeating its facts exactly and in the same order: numbers, month names, negations, capitalised words
+and known names such as cities. n-grams barely see a different budget, date or city, and those must
+never share a plan """
+
+from collections import OrderedDict, Counter
+import threading
+import hashlib
+import json
+import math
+import time
+import os
+import re
+from src.metrics import CACHE_LOOKUPS
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+# numbers (amounts, days, dates, times) and words
+TOKEN_PATTERN = re.compile(r"\d+(?:[.,:/-]\d+)*|[^\W\d_]+(?:['-][^\W\d_]+)*")
+MONTHS = {
+    "jan", "january", "feb", "february", "mar", "march", "apr", "april", "may", "jun", "june", "jul", "july",
+    "aug", "august", "sep", "sept", "september", "oct", "october", "nov", "november", "dec", "december"
+}
+NEGATIONS = {"no", "not", "nor", "never", "without", "except", "excluding", "avoid"}
+
+def facts(query: str, names: frozenset = frozenset()) -> tuple:
+    """ Tokens of a user query (original case) a similar query must repeat exactly, lowercased """
+    kept = []
+    for token in TOKEN_PATTERN.findall(query):
+        lower = token.lower()
+        if token[0].isdigit() or token[0].isupper() or lower in MONTHS or lower in NEGATIONS or lower in names:
+            kept.append(lower)
+    return tuple(kept)
+
+def ngrams(text: str, n: int = 3) -> Counter:
+    padded = f" {text} "
+    return Counter(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+
+def cosineSimilarity(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    return dot / (math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values())))
+
+class ResponseCache:
+    def __init__(
+            self,
+            path: str = None,
+            maxSize: int = 512,
+            ttl: float = 24 * 3600,
+            similarityThreshold: float = None,
+            ngramSize: int = 3,
+            templates: tuple = (),
+            names: tuple = ()
+        ):
+        """ path: JSON file the cache is persisted to (None keeps it in memory only)
+        similarityThreshold: enables the similarity layer, e.g. 0.9. None disables it
+        templates: constant user prompt prefixes, removed before comparing queries
+        names: words that must match exactly even when written in lowercase, e.g. the known cities """
+        self.path = path
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.similarityThreshold = similarityThreshold
+        self.ngramSize = ngramSize
+        self.templates = [re.sub(r"\s+", " ", template).strip() for template in templates]
+        self.names = frozenset(name.lower() for name in names)
+
+        self.entries = OrderedDict() # key -> {"system", "user", "query", "response", "createdAt"}
+        self.grams = {} # key -> n-gram counts of the user query, rebuilt on load
+        self.facts = {} # key -> facts of the user query, rebuilt on load
+        self.lock = threading.Lock() # LLM calls run on executor threads
+
+        self.exactHits = 0
+        self.similarHits = 0
+        self.misses = 0
+
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def key(systemPrompt: str, userPrompt: str) -> str:
+        return hashlib.sha256(f"{normalize(systemPrompt)}\x00{normalize(userPrompt)}".encode()).hexdigest()
+
+    def query(self, userPrompt: str) -> str:
+        """ The user's own words: whitespace collapsed, case kept, template removed """
+        text = re.sub(r"\s+", " ", userPrompt).strip()
+        for template in self.templates:
+            if text.startswith(template):
+                return text[len(template):].strip()
+        return text
+
+    def _index(self, key: str, query: str):
+        self.grams[key] = ngrams(normalize(query), self.ngramSize)
+        self.facts[key] = facts(query, self.names)
+
+    def _expired(self, entry: dict) -> bool:
+        return self.ttl is not None and time.time() - entry["createdAt"] > self.ttl
+
+    def _evict(self, key: str):
+        self.entries.pop(key, None)
+        self.grams.pop(key, None)
+        self.facts.pop(key, None)
+
+    def get(self, systemPrompt: str, userPrompt: str):
+        """ Cached response or None """
+        with self.lock:
+            key = self.key(systemPrompt, userPrompt)
+            entry = self.entries.get(key)
+            if entry and self._expired(entry):
+                self._evict(key)
+                entry = None
+            if entry:
+                self.entries.move_to_end(key)
+                self.exactHits += 1
+                CACHE_LOOKUPS.inc(cache="llm_response", result="hit")
+                return entry["response"]
+
+            if self.similarityThreshold is not None:
+                similarKey = self._mostSimilar(normalize(systemPrompt), self.query(userPrompt))
+                if similarKey:
+                    self.entries.move_to_end(similarKey)
+                    self.similarHits += 1
+                    CACHE_LOOKUPS.inc(cache="llm_response", result="similar")
+                    return self.entries[similarKey]["response"]
+
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="llm_response", result="miss")
+            return None
+
+    def _mostSimilar(self, system: str, query: str):
+        queryGrams = ngrams(normalize(query), self.ngramSize)
+        queryFacts = facts(query, self.names)
+        bestKey, bestScore = None, self.similarityThreshold
+        for key, entry in list(self.entries.items()):
+            # entries written before queries were stored only serve exact hits
+            if entry["system"] != system or self.facts.get(key) != queryFacts:
+                continue
+            if self._expired(entry):
+                self._evict(key)
+                continue
+            score = cosineSimilarity(queryGrams, self.grams[key])
+            if score >= bestScore:
+                bestKey, bestScore = key, score
+        return bestKey
+
+    def put(self, systemPrompt: str, userPrompt: str, response: str):
+        with self.lock:
+            key = self.key(systemPrompt, userPrompt)
+            query = self.query(userPrompt)
+            self.entries[key] = {
+                "system": normalize(systemPrompt),
+                "user": normalize(userPrompt),
+                "query": query,
+                "response": response,
+                "createdAt": time.time()
+            }
+            self.entries.move_to_end(key)
+            self._index(key, query)
+            while len(self.entries) > self.maxSize:
+                oldest = next(iter(self.entries))
+                self._evict(oldest)
+            if self.path:
+                self._save()
+
+    def _save(self):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(list(self.entries.items()), f)
+        os.replace(temporary, self.path) # atomic: a crash never leaves half a cache
+
+    def load(self):
+        with open(self.path) as f:
+            items = json.load(f)
+        for key, entry in items:
+            if not self._expired(entry):
+                self.entries[key] = entry
+                if "query" in entry:
+                    self._index(key, entry["query"])
+
+    @property
+    def hitRate(self) -> float:
+        lookups = self.exactHits + self.similarHits + self.misses
+        return (self.exactHits + self.similarHits) / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "exactHits": self.exactHits,
+            "similarHits": self.similarHits,
+            "misses": self.misses,
+            "hitRate": self.hitRate
+        }
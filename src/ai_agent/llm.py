@@ -1,19 +1,68 @@
 import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+import threading
+import asyncio
+import logging
+import time
 import json
 import re
+from src.ai_agent.cache import ResponseCache
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_SECONDS = metrics.histogram("llm_request_seconds", "Bedrock call latency, whole answer", labels=("mode",))
+LLM_FIRST_TEXT_SECONDS = metrics.histogram("llm_first_text_seconds", "Time to the first streamed text delta")
+LLM_ERRORS = metrics.counter("llm_errors_total", "Failed or timed out LLM calls", labels=("reason",))
 
 class LLM:
-    def __init__(self, endpoint_id: str, boto3_session: boto3.Session, region: str = "eu-north-1", version: str = "bedrock-2023-05-31"):
+    def __init__(
+            self,
+            endpoint_id: str,
+            boto3_session: boto3.Session = None,
+            region: str = "eu-north-1",
+            version: str = "bedrock-2023-05-31",
+            maxConcurrency: int = 4,
+            timeout: float = 60,
+            cache: ResponseCache = None,
+            client = None
+        ):
+        """ client replaces the bedrock-runtime client, e.g. with a local fake """
         self.model_id = endpoint_id
-        self.client = boto3_session.client("bedrock-runtime", region_name=region)
+        self.client = client or boto3_session.client(
+            "bedrock-runtime",
+            region_name=region,
+            config=Config(read_timeout=timeout, max_pool_connections=maxConcurrency)
+        )
         self.version = version
 
+        # async path: boto3 is blocking, so calls run on a dedicated bounded executor, never on the event loop
+        self.timeout = timeout
+        self.maxConcurrency = maxConcurrency
+        self.executor = ThreadPoolExecutor(max_workers=maxConcurrency, thread_name_prefix="llm")
+        self.semaphore = None # created inside the running event loop
+
+        self.cache = cache
+
     def buildPrompt(self, user: str):
         return [
             {"role":"user", "content": [{"type": "text", "text": user}]}
         ]
     
     def invoke(self, systemPrompt: str, userPrompt: str):
+        if self.cache is not None:
+            cached = self.cache.get(systemPrompt, userPrompt)
+            if cached is not None:
+                return cached
+
+        generated_text = self._invokeModel(systemPrompt, userPrompt)
+        if self.cache is not None:
+            self.cache.put(systemPrompt, userPrompt, generated_text)
+        return generated_text
+
+    def _requestBody(self, systemPrompt: str, userPrompt: str) -> str:
         prompt = self.buildPrompt(userPrompt)
 
         body = {
@@ -23,21 +72,131 @@ class LLM:
             "max_tokens": 2048,
             "temperature": 0.2
         }
+        return json.dumps(body)
 
-        response = self.client.invoke_model(
-            modelId=self.model_id,
-            contentType="application/json",
-            body=json.dumps(body)
-        )
+    def _invokeModel(self, systemPrompt: str, userPrompt: str) -> str:
+        try:
+            with LLM_SECONDS.time(mode="invoke"):
+                response = self.client.invoke_model(
+                    modelId=self.model_id,
+                    contentType="application/json",
+                    body=self._requestBody(systemPrompt, userPrompt)
+                )
 
-        payload = json.loads(response["body"].read())
-        generated_text = payload["content"][0]["text"]
+                payload = json.loads(response["body"].read())
+                generated_text = payload["content"][0]["text"]
+        except Exception:
+            LLM_ERRORS.inc(reason="error")
+            raise
 
         return generated_text
 
+    def _streamModel(self, systemPrompt: str, userPrompt: str, onText, stop: threading.Event = None):
+        """ Blocking: calls onText with every text delta of the streamed response.
+        Once stop is set, the stream is closed at its next event """
+        with LLM_SECONDS.time(mode="stream") as timer:
+            response = self.client.invoke_model_with_response_stream(
+                modelId=self.model_id,
+                contentType="application/json",
+                body=self._requestBody(systemPrompt, userPrompt)
+            )
+            try:
+                self._readStream(response["body"], onText, stop, timer.start)
+            finally:
+                close = getattr(response["body"], "close", None)
+                if close is not None:
+                    close()
+
+    def _readStream(self, stream, onText, stop: threading.Event, started: float):
+        firstText = True
+        for event in stream:
+            if stop is not None and stop.is_set():
+                return
+            chunk = event.get("chunk")
+            if not chunk:
+                continue
+            payload = json.loads(chunk["bytes"])
+            if payload.get("type") == "content_block_delta" and payload["delta"].get("type") == "text_delta":
+                if firstText:
+                    LLM_FIRST_TEXT_SECONDS.observe(time.perf_counter() - started)
+                    firstText = False
+                onText(payload["delta"]["text"])
+
+    async def astreamInvoke(self, systemPrompt: str, userPrompt: str, timeout: float = None):
+        """ Async generator of text deltas as the model produces them.
+        The blocking event stream is read on the executor and handed over through a queue """
+        if self.cache is not None:
+            cached = self.cache.get(systemPrompt, userPrompt)
+            if cached is not None:
+                yield cached
+                return
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.maxConcurrency)
+
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            queue = asyncio.Queue()
+            end = object()
+            stop = threading.Event()
+
+            def produce():
+                try:
+                    self._streamModel(systemPrompt, userPrompt, lambda text: loop.call_soon_threadsafe(queue.put_nowait, text), stop)
+                except Exception as e:
+                    LLM_ERRORS.inc(reason="error")
+                    loop.call_soon_threadsafe(queue.put_nowait, e)
+                finally:
+                    loop.call_soon_threadsafe(queue.put_nowait, end)
+
+            producer = loop.run_in_executor(self.executor, produce)
+            deadline = loop.time() + (timeout or self.timeout)
+            chunks = []
+            try:
+                while True:
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout=max(0, deadline - loop.time()))
+                    except asyncio.TimeoutError:
+                        LLM_ERRORS.inc(reason="timeout")
+                        raise
+                    if item is end:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    chunks.append(item)
+                    yield item
+            finally:
+                # timed out, failed or closed by the caller: the stream stops at its next event, and the
+                # slot is only given back once the executor thread is free, so the cap matches real use
+                stop.set()
+                await asyncio.wait([producer]) # unlike await, does not cancel it when this task is cancelled
+
+        if self.cache is not None:
+            self.cache.put(systemPrompt, userPrompt, "".join(chunks))
+
+    async def astreamTrip(self, systemPrompt: str, userPrompt: str, timeout: float = None):
+        """ Yields ("text", delta) while the answer streams in, then ("trip", result) with the same
+        result as generateTrip. The plan is parsed as soon as its closing brace arrives """
+        parser = IncrementalJSONParser()
+        chunks = []
+        async with aclosing(self.astreamInvoke(systemPrompt, userPrompt, timeout)) as stream:
+            async for text in stream:
+                chunks.append(text)
+                if parser.result is not None:
+                    continue # plan already delivered, drain the rest (closing ``` at most) so it gets cached
+                yield ("text", text)
+                if parser.feed(text) is not None:
+                    yield ("trip", parser.result)
+
+        if parser.result is None:
+            yield ("trip", self._toTrip("".join(chunks)))
+
     def generateTrip(self, systemPrompt: str, userPrompt: str) -> json:
         generatedText = self.invoke(systemPrompt, userPrompt)
-        print(generatedText)
+        return self._toTrip(generatedText)
+
+    def _toTrip(self, generatedText: str):
+        logger.debug("Generated trip: %s", generatedText)
         json_str = self._parse_response(generatedText)
 
         if not json_str:
@@ -57,4 +216,42 @@ class LLM:
 
             return structured
         except Exception as e:
-            return {}
\ No newline at end of file
+            return {}
+
+class IncrementalJSONParser:
+    """ Fed with streamed text, parses the first JSON object as soon as its closing brace arrives """
+    def __init__(self):
+        self.buffer = []
+        self.depth = 0
+        self.inString = False
+        self.escaped = False
+        self.result = None
+
+    def feed(self, text: str):
+        """ Returns the parsed object once complete, None until then """
+        for char in text:
+            if self.result is not None:
+                break
+            if self.depth == 0 and char != "{":
+                continue # text before the object, e.g. ```json
+            self.buffer.append(char)
+
+            if self.inString:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.inString = False
+            elif char == '"':
+                self.inString = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        self.result = json.loads("".join(self.buffer))
+                    except json.JSONDecodeError:
+                        self.buffer = [] # not a plan after all, keep looking
+        return self.result
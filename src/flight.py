@@ -1,8 +1,8 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Float, Date, DateTime, Index
 from sqlalchemy.orm import declarative_base, sessionmaker
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime, date
-from typing import Optional
+from typing import Optional, NamedTuple
 
 Base = declarative_base()
 
@@ -19,6 +19,19 @@ class FlightDB(Base):
     flight_number = Column(String)
     duration_hours = Column(Float)
 
+    # matched to the FlightSelection query shapes, they cover every column of the WHERE clause
+    __table_args__ = (
+        Index("ix_flights_route_date", "from_city", "to_city", "departure_date", "price_eur", "stayovers"),
+        Index("ix_flights_origin_date", "from_city", "departure_date", "price_eur"),
+    )
+
+class DatasetVersionDB(Base):
+    """ Single row stamp of the flights table, bumped by triggers on every change (see flightStore) """
+    __tablename__ = "dataset_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(String, nullable=False)
+
 class Flight(BaseModel):
     from_city: str
     to_city: str
@@ -42,6 +55,23 @@ class Flight(BaseModel):
         f"Price: {self.price_eur} euro | " \
         f"Stayovers: {self.stayovers}"
     
+class FlightRecord(NamedTuple):
+    """ Lightweight flight used along the search path: plain tuples straight from the query,
+    no ORM nor validation. Turned into a Flight only for the plan shown to the user """
+    id: int
+    from_city: str
+    to_city: str
+    departure_date: date
+    departure_time_local: datetime
+    arrival_time_local: datetime
+    price_eur: float
+    stayovers: int
+    flight_number: str
+    duration_hours: float
+
+    def toFlight(self) -> Flight:
+        return Flight.model_validate(self, from_attributes=True)
+
 class FlightSelection(BaseModel):
     startDate: date # spectrum of days you want to fly
     endDate: date
@@ -0,0 +1,72 @@
+""" In-memory columnar copy of the flights table.
+Rows are partitioned by (from_city, to_city) and sorted by departure date, so a FlightSelection
+is answered with a binary search on the dates plus boolean masks on price and stayovers """
+
+from sqlalchemy import select
+from src.flight import FlightDB, FlightSelection, FlightRecord
+import numpy as np
+
+class ColumnarFlightIndex:
+    def __init__(self, rows: list[FlightRecord]):
+        """ rows must come sorted by (from_city, to_city, departure_date) """
+        self.records = rows
+        self.dates = np.fromiter((row.departure_date.toordinal() for row in rows), dtype=np.int32, count=len(rows))
+        self.prices = np.fromiter((row.price_eur for row in rows), dtype=np.float64, count=len(rows))
+        self.stayovers = np.fromiter((row.stayovers for row in rows), dtype=np.int16, count=len(rows))
+
+        # (from_city, to_city) -> [start, end) slice of the columns
+        self.partitions = {}
+        # from_city -> list of (to_city, start, end)
+        self.partitionsByOrigin = {}
+
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or (rows[i].from_city, rows[i].to_city) != (rows[start].from_city, rows[start].to_city):
+                fromCity, toCity = rows[start].from_city, rows[start].to_city
+                self.partitions[(fromCity, toCity)] = (start, i)
+                self.partitionsByOrigin.setdefault(fromCity, []).append((toCity, start, i))
+                start = i
+
+    @classmethod
+    def load(cls, engine):
+        """ Read the whole flights table once """
+        table = FlightDB.__table__
+        query = select(*(table.c[field] for field in FlightRecord._fields)).order_by(
+            table.c.from_city, table.c.to_city, table.c.departure_date, table.c.id
+        )
+        with engine.connect() as connection:
+            return cls([FlightRecord._make(row) for row in connection.execute(query)])
+
+    def __len__(self):
+        return len(self.records)
+
+    def retrieveFlights(self, trip: FlightSelection):
+        vetoed = set(trip.vetoDestinations or [])
+        if trip.destinationCity:
+            bounds = self.partitions.get((trip.startCity, trip.destinationCity))
+            partitions = [bounds] if bounds and trip.destinationCity not in vetoed else []
+        else:
+            partitions = [
+                (start, end) for toCity, start, end in self.partitionsByOrigin.get(trip.startCity, [])
+                if toCity not in vetoed
+            ]
+
+        startDate = trip.startDate.toordinal()
+        endDate = trip.endDate.toordinal()
+
+        flights = []
+        for start, end in partitions:
+            dates = self.dates[start:end]
+            first = start + np.searchsorted(dates, startDate, side="left")
+            last = start + np.searchsorted(dates, endDate, side="right")
+            if first >= last:
+                continue
+
+            mask = np.ones(last - first, dtype=bool)
+            if trip.priceMax:
+                mask &= self.prices[first:last] <= trip.priceMax
+            if not trip.stayoversAllowed:
+                mask &= self.stayovers[first:last] == 0
+
+            flights.extend(self.records[i] for i in first + np.flatnonzero(mask))
+        return flights
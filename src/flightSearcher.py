@@ -1,11 +1,62 @@
-from src.flight import FlightDB, FlightSelection
-from sqlalchemy import create_engine
+from src.flight import FlightDB, FlightSelection, FlightRecord
+from src.flightStore import configureEngine, migrate, datasetVersion
+from src.flightIndex import ColumnarFlightIndex
+from sqlalchemy import create_engine, select
 from sqlalchemy.orm import sessionmaker
+from datetime import timedelta
+from bisect import bisect_left, bisect_right
+from contextlib import asynccontextmanager
+import asyncio
+from src import metrics
+
+QUERY_SECONDS = metrics.histogram("flight_query_seconds", "retrieveFlights latency", labels=("backend",))
+QUERY_ROWS = metrics.histogram(
+    "flight_query_rows", "Flights returned per retrieveFlights call", labels=("backend",),
+    buckets=(0, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+)
+POOL_WAIT_SECONDS = metrics.histogram("flight_pool_wait_seconds", "Wait for a free pooled async connection")
 
 class FlightEngine:
-    def __init__(self, databaseName: str):
-        self.engine = create_engine(f'sqlite:///{databaseName}.db')
+    def __init__(self, databaseName: str, applyMigrations: bool = True, backend: str = "sql", poolSize: int = 5):
+        """ backend "sql" queries SQLite on every call, "columnar" loads the flights table
+        once into memory and answers the searches from there.
+        poolSize bounds the connections shared by every caller, sync and async engines alike """
+        self.databaseName = databaseName
+        self.poolSize = poolSize
+        self.engine = configureEngine(create_engine(
+            f'sqlite:///{databaseName}.db',
+            pool_size=poolSize,
+            max_overflow=0
+        ))
         self.Session = sessionmaker(bind=self.engine)
+        self.asyncEngine = None # created on the first async query
+        if applyMigrations:
+            migrate(self.engine)
+
+        self.backend = backend
+        self.index = None
+        self.indexVersion = None
+        self.reloading = None # background reload started by adatasetVersion
+        if backend == "columnar":
+            self.reloadIndex()
+        elif backend != "sql":
+            raise ValueError(f"Unknown flight backend: {backend}")
+
+    def reloadIndex(self):
+        """ Pick up changes of the flights table when running on the columnar backend """
+        if self.backend == "columnar":
+            with self.engine.connect() as connection:
+                version = datasetVersion(connection)
+            index = ColumnarFlightIndex.load(self.engine)
+            self.index, self.indexVersion = index, version # searches running meanwhile keep the old index
+
+    def datasetVersion(self) -> str:
+        """ Current stamp of the flights table. The columnar index is reloaded when it is behind """
+        with self.engine.connect() as connection:
+            version = datasetVersion(connection)
+        if self.index is not None and version != self.indexVersion:
+            self.reloadIndex()
+        return version
 
     def retrieveAllFlights(self):
         session = self.Session()
@@ -14,23 +65,146 @@ class FlightEngine:
         finally:
             session.close()
 
-    def retrieveFlights(self, trip: FlightSelection):
-        session = self.Session()
+    def _flightsQuery(self, trip: FlightSelection):
+        # Core select: rows come back as plain tuples, skipping the ORM identity map and hydration
+        table = FlightDB.__table__
+        filters = [
+            table.c.departure_date >= trip.startDate,
+            table.c.departure_date <= trip.endDate,
+            table.c.from_city == trip.startCity,
+        ]
+        if trip.priceMax:
+            filters.append(table.c.price_eur <= trip.priceMax)
+        if trip.destinationCity:
+            filters.append(table.c.to_city == trip.destinationCity)
+        if trip.vetoDestinations: # filter out with ~
+            filters.append(~table.c.to_city.in_(trip.vetoDestinations))
+        if not trip.stayoversAllowed:
+            filters.append(table.c.stayovers == 0)
+
+        # stable order, so route tables (and the genome indexes into them) are the same in every process
+        return select(*(table.c[field] for field in FlightRecord._fields)).where(*filters).order_by(
+            table.c.departure_date, table.c.id
+        )
+
+    def retrieveFlights(self, trip: FlightSelection) -> list[FlightRecord]:
+        with QUERY_SECONDS.time(backend=self.backend):
+            if self.index is not None:
+                flights = self.index.retrieveFlights(trip)
+            else:
+                with self.engine.connect() as connection:
+                    flights = [FlightRecord._make(row) for row in connection.execute(self._flightsQuery(trip))]
+        QUERY_ROWS.observe(len(flights), backend=self.backend)
+        return flights
+
+    def _returnSelection(self, trip: FlightSelection, goingFlights: list[FlightRecord], days: int) -> FlightSelection:
+        """ Every candidate flight back for the whole window of outbound flights """
+        firstDeparture = min(flight.departure_date for flight in goingFlights)
+        lastDeparture = max(flight.departure_date for flight in goingFlights)
+        return FlightSelection(
+            startDate=firstDeparture + timedelta(days=1),
+            endDate=lastDeparture + timedelta(days=days),
+            priceMax=trip.priceMax, # no return can be pricier than the whole trip
+            startCity=trip.destinationCity,
+            destinationCity=trip.startCity,
+            stayoversAllowed=trip.stayoversAllowed
+        )
+
+    def _pairRoundTrips(self, trip: FlightSelection, goingFlights: list[FlightRecord], flightsBack: list[FlightRecord], days: int):
+        flightsBack = sorted(flightsBack, key=lambda flight: flight.departure_date)
+        backDates = [flight.departure_date for flight in flightsBack]
+
+        roundTrips = []
+        for goingFlight in goingFlights:
+            start = bisect_left(backDates, goingFlight.departure_date + timedelta(days=1))
+            end = bisect_right(backDates, goingFlight.departure_date + timedelta(days=days))
+            candidates = flightsBack[start:end]
+
+            remainingBudget = trip.priceMax - goingFlight.price_eur if trip.priceMax else None
+            if remainingBudget:
+                candidates = [flight for flight in candidates if flight.price_eur <= remainingBudget]
+
+            roundTrips.append((goingFlight, candidates))
+        return roundTrips
+
+    def retrieveRoundTrips(self, trip: FlightSelection, days: int):
+        """ Bulk version of looking up the flights back for every outbound flight.
+        All candidate return flights destination -> origin are fetched with a single query
+        covering the whole window, and each outbound flight takes its [dep+1, dep+days] slice
+        from the date-sorted list. Returns a list of (flightToGo, flightsBack) """
+        goingFlights = self.retrieveFlights(trip)
+        if not goingFlights:
+            return []
+
+        flightsBack = self.retrieveFlights(self._returnSelection(trip, goingFlights, days))
+        return self._pairRoundTrips(trip, goingFlights, flightsBack, days)
+
+    def _getAsyncEngine(self):
+        if self.asyncEngine is None:
+            # imported here: the async stack (greenlet, aiosqlite) is only needed by the async API
+            from sqlalchemy.ext.asyncio import create_async_engine
+            self.asyncEngine = create_async_engine(
+                f'sqlite+aiosqlite:///{self.databaseName}.db',
+                pool_size=self.poolSize,
+                max_overflow=0
+            )
+            configureEngine(self.asyncEngine.sync_engine)
+        return self.asyncEngine
+
+    async def adatasetVersion(self) -> str:
+        """ datasetVersion for the event loop. A columnar index that is behind is reloaded in a background
+        thread, and the version it still serves is returned until then, so results are stamped with the data they came from """
+        async with self._getAsyncEngine().connect() as connection:
+            version = await connection.run_sync(datasetVersion)
+        if self.index is None or version == self.indexVersion:
+            return version
+        if self.reloading is None or self.reloading.done():
+            self.reloading = asyncio.get_running_loop().run_in_executor(None, self.reloadIndex)
+        return self.indexVersion
+
+    @asynccontextmanager
+    async def aconnect(self):
+        """ Pooled async connection for one or more queries, None on the columnar backend.
+        The wait for a free connection goes to its own histogram, not to the query times """
+        if self.index is not None:
+            yield None
+            return
+        with POOL_WAIT_SECONDS.time():
+            connection = await self._getAsyncEngine().connect().start()
         try:
-            filters = [
-                FlightDB.departure_date >= trip.startDate,
-                FlightDB.departure_date <= trip.endDate,
-                FlightDB.from_city == trip.startCity,
-            ]
-            if trip.priceMax:
-                filters.append(FlightDB.price_eur <= trip.priceMax)
-            if trip.destinationCity:
-                filters.append(FlightDB.to_city == trip.destinationCity)
-            if trip.vetoDestinations: # filter out with ~
-                filters.append(~FlightDB.to_city.in_(trip.vetoDestinations))
-            if not trip.stayoversAllowed:
-                filters.append(FlightDB.stayovers == 0)
-
-            return session.query(FlightDB).filter(*filters).all()
+            yield connection
         finally:
-            session.close()
+            await connection.close()
+
+    async def aretrieveFlights(self, trip: FlightSelection, connection=None) -> list[FlightRecord]:
+        """ Same as retrieveFlights, on the pooled aiosqlite engine so the event loop is never blocked.
+        connection: from aconnect, one is checked out for this query when None """
+        if self.index is None and connection is None:
+            async with self.aconnect() as connection:
+                return await self.aretrieveFlights(trip, connection)
+
+        with QUERY_SECONDS.time(backend=self.backend):
+            if self.index is not None:
+                flights = self.index.retrieveFlights(trip)
+            else:
+                result = await connection.execute(self._flightsQuery(trip))
+                flights = [FlightRecord._make(row) for row in result]
+        QUERY_ROWS.observe(len(flights), backend=self.backend)
+        return flights
+
+    async def aretrieveRoundTrips(self, trip: FlightSelection, days: int, connection=None):
+        if self.index is None and connection is None:
+            async with self.aconnect() as connection: # both queries on the same connection
+                return await self.aretrieveRoundTrips(trip, days, connection)
+
+        goingFlights = await self.aretrieveFlights(trip, connection)
+        if not goingFlights:
+            return []
+
+        flightsBack = await self.aretrieveFlights(self._returnSelection(trip, goingFlights, days), connection)
+        return self._pairRoundTrips(trip, goingFlights, flightsBack, days)
+
+    async def aclose(self):
+        if self.asyncEngine is not None:
+            await self.asyncEngine.dispose()
+            self.asyncEngine = None
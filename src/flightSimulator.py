@@ -0,0 +1,280 @@
+""" Synthetic flights dataset, generated in vectorized NumPy batches and bulk inserted into SQLite.
+Every batch draws from its own random stream spawned from the seed, so the output only depends on
+the seed and the parameters """
+
+from datetime import datetime, timedelta, date
+from sqlalchemy import create_engine
+from sqlalchemy.schema import CreateTable
+from src.flight import FlightDB
+from src.flightStore import PRAGMAS, configureEngine, migrate, bumpDatasetVersion
+import numpy as np
+import multiprocessing
+import math
+import pytz
+import os
+
+MAJOR_EUROPEAN_HOLIDAYS = {
+    # Fixed dates
+    date(2025, 1, 1),   # New Year's Day
+    date(2025, 12, 24), # Christmas Eve
+    date(2025, 12, 25), # Christmas
+    date(2025, 12, 31), # New Year's Eve
+    date(2025, 5, 1),   # Labour Day
+
+    # Easter-related, approximately
+    date(2025, 4, 18),
+    date(2025, 4, 20),
+    date(2025, 4, 21),
+}
+
+SUMMER_HOTSPOTS = {
+    "Barcelona", "Nice", "Athens", "Rome", "Lisbon",
+    "Split", "Valletta", "Dubrovnik", "Palermo",
+    "Malta", "Marseille", "Seville", "Valencia",
+    "Porto", "Thessaloniki", "Naples", "Santorini",
+    "Ibiza", "Mykonos", "Cannes", "Corfu", "Malaga"
+}
+
+european_cities = {
+    "London": "Europe/London",
+    "Manchester": "Europe/London",
+    "Paris": "Europe/Paris",
+    "Lyon": "Europe/Paris",
+    "Marseille": "Europe/Paris",
+    "Brussels": "Europe/Brussels",
+    "Amsterdam": "Europe/Amsterdam",
+    "Rotterdam": "Europe/Amsterdam",
+    "Luxembourg": "Europe/Luxembourg",
+    "Berlin": "Europe/Berlin",
+    "Frankfurt": "Europe/Berlin",
+    "Munich": "Europe/Berlin",
+    "Vienna": "Europe/Vienna",
+    "Zurich": "Europe/Zurich",
+    "Geneva": "Europe/Zurich",
+    "Prague": "Europe/Prague",
+    "Bratislava": "Europe/Bratislava",
+    "Warsaw": "Europe/Warsaw",
+    "Krakow": "Europe/Warsaw",
+    "Budapest": "Europe/Budapest",
+    "Rome": "Europe/Rome",
+    "Milan": "Europe/Rome",
+    "Naples": "Europe/Rome",
+    "Palermo": "Europe/Rome",
+    "Madrid": "Europe/Madrid",
+    "Barcelona": "Europe/Madrid",
+    "Valencia": "Europe/Madrid",
+    "Malaga": "Europe/Madrid",
+    "Seville": "Europe/Madrid",
+    "Lisbon": "Europe/Lisbon",
+    "Porto": "Europe/Lisbon",
+    "Athens": "Europe/Athens",
+    "Thessaloniki": "Europe/Athens",
+    "Malta": "Europe/Malta",
+    "Stockholm": "Europe/Stockholm",
+    "Gothenburg": "Europe/Stockholm",
+    "Oslo": "Europe/Oslo",
+    "Bergen": "Europe/Oslo",
+    "Copenhagen": "Europe/Copenhagen",
+    "Helsinki": "Europe/Helsinki",
+    "Tallinn": "Europe/Tallinn",
+    "Riga": "Europe/Riga",
+    "Vilnius": "Europe/Vilnius",
+    "Sofia": "Europe/Sofia",
+    "Bucharest": "Europe/Bucharest",
+    "Belgrade": "Europe/Belgrade",
+    "Skopje": "Europe/Skopje",
+    "Sarajevo": "Europe/Sarajevo",
+    "Podgorica": "Europe/Podgorica",
+    "Tirana": "Europe/Tirane",
+    "Chisinau": "Europe/Chisinau",
+    "Ljubljana": "Europe/Ljubljana",
+    "Zagreb": "Europe/Zagreb",
+    "Andorra la Vella": "Europe/Andorra",
+    "San Marino": "Europe/Rome",
+    "Monaco": "Europe/Monaco",
+    "Vaduz": "Europe/Vaduz",
+    "Reykjavik": "Atlantic/Reykjavik",
+    "Dublin": "Europe/Dublin"
+}
+
+CARRIERS = ['LH', 'AF', 'BA', 'IB', 'KL', 'SK', 'LO', 'AZ']
+COLUMNS = ["from_city", "to_city", "departure_date", "departure_time_local", "arrival_time_local",
+           "price_eur", "stayovers", "flight_number", "duration_hours"]
+
+# loading only: durability comes back with the default pragmas once the table is indexed
+LOAD_PRAGMAS = {**PRAGMAS, "synchronous": "OFF"}
+
+def utcOffsets(cities: list[str], startDate: date, numDays: int) -> np.ndarray:
+    """ Minutes east of UTC per (city, day), taken at noon: DST switches at night, before any departure """
+    offsets = np.empty((len(cities), numDays), dtype=np.int64)
+    for i, city in enumerate(cities):
+        tz = pytz.timezone(european_cities[city])
+        for day in range(numDays):
+            noon = datetime.combine(startDate + timedelta(days=day), datetime.min.time()).replace(hour=12)
+            offsets[i, day] = int(tz.utcoffset(noon).total_seconds() // 60)
+    return offsets
+
+def dynamic_price(base_price, dep_local, stayovers, duration_hours, to_hotspot, today: date):
+    """ Vectorized pricing: same rules as the original per-flight function.
+    dep_local is a datetime64[m] array of local departure times """
+    dep_day = dep_local.astype("datetime64[D]")
+    days_until_departure = (dep_day - np.datetime64(today, "D")).astype(np.int64)
+    weekday = (dep_day.astype(np.int64) + 3) % 7 # 1970-01-01 was a Thursday; Monday = 0
+    month = dep_day.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    hour = (dep_local - dep_day).astype(np.int64) // 60
+
+    price = base_price.astype(np.float64)
+
+    # 1. Price increases as date approaches
+    price *= np.select(
+        [days_until_departure < 7, days_until_departure < 30, days_until_departure < 60, days_until_departure > 120],
+        [1.5, 1.35, 1.2, 0.85],
+        default=1.0
+    )
+    # 2. Weekend multiplier
+    price *= np.where(np.isin(weekday, (4, 5)), 1.15, 1.0)
+    # 3. Stayovers discount
+    price *= np.where(stayovers == 1, 0.85, 1.0)
+    # 4. Peak hours (morning & evening)
+    price *= np.where(((hour >= 7) & (hour <= 9)) | ((hour >= 17) & (hour <= 20)), 1.1, 1.0)
+    # 5. Longer flights = potentially higher cost
+    price *= 1 + (duration_hours / 10)
+    # 6. Holidays
+    holidays = np.array(sorted(MAJOR_EUROPEAN_HOLIDAYS), dtype="datetime64[D]")
+    price *= np.where(np.isin(dep_day, holidays), 1.25, 1.0)
+    # 7. Hotspots for summer
+    price *= np.where(to_hotspot & np.isin(month, (6, 7, 8)), 1.3, 1.0)
+
+    return np.round(price, 2)
+
+def generateBatch(rng: np.random.Generator, size: int, cities: list[str], startDate: date, numDays: int,
+                  offsets: np.ndarray, today: date) -> list[tuple]:
+    """ One batch of flights, as rows ready for executemany. offsets: utcOffsets over numDays + 1 days """
+    numCities = len(cities)
+    fromIndex = rng.integers(0, numCities, size)
+    toIndex = rng.integers(0, numCities - 1, size)
+    toIndex += toIndex >= fromIndex # two different cities
+
+    dayIndex = rng.integers(0, numDays, size)
+    base_price = rng.integers(10, 301, size)
+    duration_hours = np.round(rng.uniform(1.0, 5.0, size), 1)
+    stayovers = rng.integers(0, 2, size)
+    dep_hour = rng.integers(5, 23, size)
+    dep_minute = rng.choice([0, 15, 30, 45], size)
+    carriers = rng.integers(0, len(CARRIERS), size)
+    numbers = rng.integers(100, 10000, size)
+
+    dep_day = np.datetime64(startDate, "D") + dayIndex
+    dep_local = dep_day.astype("datetime64[m]") + (dep_hour * 60 + dep_minute)
+    # local -> UTC at the origin, + duration, UTC -> local at the destination on the day of arrival:
+    # late flights land the next day, which may be past a DST switch
+    arr_utc = dep_local - offsets[fromIndex, dayIndex] + np.round(duration_hours * 60).astype(np.int64)
+    arrivalIndex = (arr_utc.astype("datetime64[D]") - np.datetime64(startDate, "D")).astype(np.int64)
+    arr_local = arr_utc + offsets[toIndex, arrivalIndex]
+
+    hotspots = np.array([city in SUMMER_HOTSPOTS for city in cities])
+    price_eur = dynamic_price(base_price, dep_local, stayovers, duration_hours, hotspots[toIndex], today)
+
+    # same text format SQLAlchemy writes for Date and DateTime columns on SQLite
+    cityNames = np.array(cities, dtype=object)
+    departure_date = np.datetime_as_string(dep_day, unit="D")
+    departure_time = np.char.add(np.char.replace(np.datetime_as_string(dep_local, unit="s"), "T", " "), ".000000")
+    arrival_time = np.char.add(np.char.replace(np.datetime_as_string(arr_local, unit="s"), "T", " "), ".000000")
+    flight_number = np.char.add(np.array(CARRIERS)[carriers], numbers.astype(str))
+
+    return list(zip(
+        cityNames[fromIndex].tolist(),
+        cityNames[toIndex].tolist(),
+        departure_date.tolist(),
+        departure_time.tolist(),
+        arrival_time.tolist(),
+        price_eur.tolist(),
+        stayovers.tolist(),
+        flight_number.tolist(),
+        duration_hours.tolist()
+    ))
+
+def batchSizes(rows: int, batchSize: int) -> list[int]:
+    return [min(batchSize, rows - start) for start in range(0, rows, batchSize)]
+
+def createLoadEngine(databasePath: str):
+    """ Fresh database with the flights table and no index yet: indexes are built once, after the load """
+    if os.path.exists(databasePath):
+        os.remove(databasePath)
+    engine = configureEngine(create_engine(f"sqlite:///{databasePath}"), LOAD_PRAGMAS)
+    with engine.begin() as connection:
+        connection.execute(CreateTable(FlightDB.__table__))
+    return engine
+
+INSERT = f"INSERT INTO {FlightDB.__tablename__} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+def writeBatches(engine, batches: list[tuple], cities: list[str], startDate: date, days: int, today: date):
+    """ batches: (random stream, size) pairs, written in order """
+    offsets = utcOffsets(cities, startDate, days + 1) # + 1: arrivals of the last day's late flights
+    for stream, size in batches:
+        batch = generateBatch(np.random.default_rng(stream), size, cities, startDate, days, offsets, today)
+        with engine.begin() as connection: # one transaction per batch
+            connection.exec_driver_sql(INSERT, batch)
+
+def generateShard(task) -> str:
+    """ Worker: write a contiguous range of batches into its own shard database """
+    shardPath, batches, cities, startDate, days, today = task
+    engine = createLoadEngine(shardPath)
+    writeBatches(engine, batches, cities, startDate, days, today)
+    engine.dispose()
+    return shardPath
+
+def mergeShards(engine, shardPaths: list[str]):
+    """ Append the shards in order: ids, and so the whole table, do not depend on the number of workers """
+    connection = engine.raw_connection()
+    try:
+        for shardPath in shardPaths:
+            connection.execute("ATTACH DATABASE ? AS shard", (shardPath,))
+            connection.execute(
+                f"INSERT INTO {FlightDB.__tablename__} ({', '.join(COLUMNS)}) "
+                f"SELECT {', '.join(COLUMNS)} FROM shard.{FlightDB.__tablename__} ORDER BY id"
+            )
+            connection.commit()
+            connection.execute("DETACH DATABASE shard")
+            os.remove(shardPath)
+    finally:
+        connection.close()
+
+def simulate(
+        database: str = "flightsAPI",
+        rows: int = 200000,
+        seed: int = None,
+        startDate: date = None,
+        days: int = 180,
+        cities: list[str] = None,
+        batchSize: int = 100000,
+        today: date = None,
+        workers: int = 1
+    ):
+    """ Write `rows` flights departing within `days` days from startDate into <database>.db
+    With workers > 1 the batches are split into contiguous shards generated by a process pool,
+    then merged. The result is the same for any number of workers """
+    startDate = startDate or date.today()
+    today = today or date.today()
+    cities = cities or list(european_cities.keys())
+
+    sizes = batchSizes(rows, batchSize)
+    batches = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+
+    engine = createLoadEngine(f"{database}.db")
+    if workers <= 1:
+        writeBatches(engine, batches, cities, startDate, days, today)
+    else:
+        shardSize = math.ceil(len(batches) / workers)
+        tasks = [
+            (f"{database}.shard{i}.db", batches[start:start + shardSize], cities, startDate, days, today)
+            for i, start in enumerate(range(0, len(batches), shardSize))
+        ]
+        with multiprocessing.get_context("spawn").Pool(processes=min(workers, len(tasks))) as pool:
+            shardPaths = pool.map(generateShard, tasks)
+        mergeShards(engine, shardPaths)
+
+    # indexes and planner statistics for the freshly loaded table
+    migrate(engine, analyze=True)
+    bumpDatasetVersion(engine) # rows were bulk loaded before the triggers existed
+    engine.dispose()
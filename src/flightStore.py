@@ -0,0 +1,79 @@
+""" Managed schema for the flights database.
+Indexes live in FlightDB.__table_args__, this module applies them to existing databases,
+refreshes the planner statistics, keeps the dataset version stamp and tunes the SQLite connection """
+
+from sqlalchemy import event, inspect, text
+from src.flight import Base, FlightDB, DatasetVersionDB
+
+# WAL lets the WebSocket sessions keep reading while the simulator is writing
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456, # 256 MiB
+    "cache_size": -65536, # negative means KiB -> 64 MiB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000 # milliseconds
+}
+
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+BUMP_VERSION = f"UPDATE {DatasetVersionDB.__tablename__} SET version = version + 1, updated_at = {NOW} WHERE id = 1"
+# any write to the flights table moves the stamp, whoever makes it
+VERSION_TRIGGERS = {
+    f"{FlightDB.__tablename__}_version_{operation.lower()}": (
+        f"CREATE TRIGGER IF NOT EXISTS {FlightDB.__tablename__}_version_{operation.lower()} "
+        f"AFTER {operation} ON {FlightDB.__tablename__} BEGIN {BUMP_VERSION}; END"
+    )
+    for operation in ("INSERT", "UPDATE", "DELETE")
+}
+
+def configureEngine(engine, pragmas: dict = None):
+    """ Apply the pragmas to every new connection of the engine's pool """
+    pragmas = PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, "connect")
+    def setPragmas(dbapiConnection, connectionRecord):
+        cursor = dbapiConnection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    return engine
+
+def migrate(engine, analyze: bool = None) -> list[str]:
+    """ Create the flights table and any index missing from it.
+    ANALYZE runs when an index was added (or when forced), so the query planner picks them up.
+    Returns the names of the indexes created """
+    Base.metadata.create_all(engine) # brand new tables get their indexes here
+
+    created = []
+    with engine.begin() as connection:
+        existing = {index["name"] for index in inspect(connection).get_indexes(FlightDB.__tablename__)}
+        for index in FlightDB.__table__.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                created.append(index.name)
+
+        connection.execute(text(
+            f"INSERT OR IGNORE INTO {DatasetVersionDB.__tablename__} (id, version, updated_at) VALUES (1, 0, {NOW})"
+        ))
+        for trigger in VERSION_TRIGGERS.values():
+            connection.execute(text(trigger))
+
+        if analyze or (analyze is None and created):
+            connection.execute(text("ANALYZE"))
+
+    return created
+
+def datasetVersion(connection) -> str:
+    """ Stamp of the flights table: the write counter plus the time of the last write,
+    so a regenerated database never repeats the stamp of the previous one """
+    row = connection.execute(text(
+        f"SELECT version, updated_at FROM {DatasetVersionDB.__tablename__} WHERE id = 1"
+    )).first()
+    return f"{row[0]}@{row[1]}" if row else None
+
+def bumpDatasetVersion(engine):
+    with engine.begin() as connection:
+        connection.execute(text(BUMP_VERSION))
@@ -0,0 +1,181 @@
+from collections import OrderedDict, Counter
+from typing import NamedTuple
+import hashlib
+import json
+from src.metrics import CACHE_LOOKUPS
+
+class LRUCache:
+    """ Size-bounded memo with least-recently-used eviction and hit/miss counters """
+    name = "lru" # label of the cache_lookups_total metric
+    def __init__(self, maxSize: int = 128):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.hitCounter = CACHE_LOOKUPS.labels(cache=self.name, result="hit")
+        self.missCounter = CACHE_LOOKUPS.labels(cache=self.name, result="miss")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.hitCounter.inc()
+            return self.entries[key]
+        self.misses += 1
+        self.missCounter.inc()
+        return default
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False) # least recently used goes first
+
+    def fill(self, key, value):
+        """ put of a value computed ahead of the lookups (prefetching): the key was missing, counted as a miss """
+        self.misses += 1
+        self.missCounter.inc()
+        self.put(key, value)
+
+    def getOrCompute(self, key, compute):
+        if key in self.entries:
+            return self.get(key)
+        self.misses += 1
+        self.missCounter.inc()
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hitRate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "maxSize": self.maxSize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hitRate
+        }
+
+class RouteCache(LRUCache):
+    """ Potential routes per (origin, destination, plan constraints), shared by every individual of a run.
+    The cached lists are shared between individuals, so they must never be mutated """
+    name = "route"
+
+    @staticmethod
+    def key(originCity: str, destination: str, plan) -> tuple:
+        return (originCity, destination, plan.constraintsKey())
+
+    def getRoutes(self, originCity: str, destination: str, plan, flightEngine):
+        return self.getOrCompute(
+            self.key(originCity, destination, plan),
+            lambda: plan.createRoutes(originCity, destination, flightEngine)
+        )
+
+class EvaluationCache(LRUCache):
+    """ Fitness per genome key (destination plus the selected flight ids), shared by every run
+    of the same GeneticAlgorithm. Hits and misses are also kept per generation """
+    name = "evaluation"
+
+    def __init__(self, maxSize: int = 4096):
+        super().__init__(maxSize)
+        self.generationStats = []
+        self.markedHits = 0
+        self.markedMisses = 0
+
+    def markGeneration(self):
+        self.generationStats.append({
+            "hits": self.hits - self.markedHits,
+            "misses": self.misses - self.markedMisses
+        })
+        self.markedHits, self.markedMisses = self.hits, self.misses
+
+class PlanResult(NamedTuple):
+    """ Best Trip of a finished run, by flight ids so it outlives the route tables it was built on """
+    destination: str
+    travellers: tuple # (origin, budget) per traveller, in canonical order
+    flightIds: tuple # (flightToGo id, flightBack id) per traveller, same order
+    score: float
+    message: str # the final plan as it was sent
+
+    def assign(self, travellers) -> list:
+        """ Flight ids for the given travellers, in their order: matched on (origin, budget),
+        then on origin alone. None when an origin of the group is missing from the result """
+        pending = list(zip(self.travellers, self.flightIds))
+        assigned = []
+        for traveller in travellers:
+            match = next((i for i, ((origin, budget), _) in enumerate(pending) if (origin, budget) == (traveller.origin, traveller.budget)), None)
+            if match is None:
+                match = next((i for i, ((origin, _), _) in enumerate(pending) if origin == traveller.origin), None)
+            if match is None:
+                return None
+            assigned.append(pending.pop(match)[1])
+        return assigned
+
+class PlanCache(LRUCache):
+    """ Best result per (canonical plan, flights dataset version).
+    A new dataset version makes every older entry unreachable, LRU eviction clears them out """
+    name = "plan"
+
+    @staticmethod
+    def canonicalTravellers(travellers) -> tuple:
+        return tuple(sorted((traveller.origin, float(traveller.budget)) for traveller in travellers))
+
+    @staticmethod
+    def planHash(travellers, plan) -> str:
+        """ Order-insensitive hash of everything the objective depends on
+        (preferredCities is not used by the planners, so it does not split the cache) """
+        canonical = {
+            "travellers": PlanCache.canonicalTravellers(travellers),
+            "fromDate": plan.fromDate,
+            "toDate": plan.toDate,
+            "vetoCities": sorted(plan.vetoCities or []),
+            "priceMax": plan.priceMax,
+            "days": plan.days,
+            "allowStayover": plan.allowStayover,
+            "availableDestinations": sorted(plan.availableDestinations or [])
+        }
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True, default=str).encode()).hexdigest()
+
+    def getResult(self, travellers, plan, datasetVersion: str) -> PlanResult:
+        return self.get((self.planHash(travellers, plan), datasetVersion))
+
+    def putTrip(self, travellers, plan, datasetVersion: str, trip, message: str):
+        order = sorted(range(len(trip.travellers)), key=lambda i: (trip.travellers[i].origin, float(trip.travellers[i].budget)))
+        routes = trip.selectedRoutes()
+        self.put((self.planHash(travellers, plan), datasetVersion), PlanResult(
+            destination=trip.chosenDestination,
+            travellers=tuple((trip.travellers[i].origin, float(trip.travellers[i].budget)) for i in order),
+            flightIds=tuple((routes[i].flightToGo.id, routes[i].flightBack.id) for i in order),
+            score=trip.fitness.values[0],
+            message=message
+        ))
+
+    def similar(self, travellers, plan, datasetVersion: str, limit: int = 5) -> list[PlanResult]:
+        """ Results of other plans of the same group of origins on the same dataset, most recent first:
+        their trips are good starting points when only budgets, dates or destinations changed """
+        planHash = self.planHash(travellers, plan)
+        origins = Counter(traveller.origin for traveller in travellers)
+        results = []
+        for (otherHash, version), result in reversed(self.entries.items()):
+            if version != datasetVersion or otherHash == planHash:
+                continue
+            if Counter(origin for origin, _ in result.travellers) == origins:
+                results.append(result)
+                if len(results) == limit:
+                    break
+        return results
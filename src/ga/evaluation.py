@@ -0,0 +1,57 @@
+""" Population-wide fitness evaluation.
+Same penalty terms and normalization as GeneticAlgorithm.evaluate_individual, computed for the
+whole population at once over (individuals x travellers) arrays """
+
+from datetime import datetime
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1) # local times are naive, so they are measured against a naive epoch
+DELTA_TIME_PENALTY = 50
+
+def evaluatePopulation(population: list, daysSelected: int) -> list[tuple[float]]:
+    if not population:
+        return []
+
+    selected = [individual.selectedRoutes() for individual in population]
+    budgets = np.array([traveller.budget for traveller in population[0].travellers], dtype=np.float64)
+    numTravellers = len(budgets)
+
+    costs = np.array([[route.cost for route in routes] for routes in selected], dtype=np.float64)
+    arrivals = np.array([[(route.flightToGo.arrival_time_local - EPOCH).total_seconds() for route in routes] for routes in selected])
+    departuresBack = np.array([[(route.flightBack.departure_time_local - EPOCH).total_seconds() for route in routes] for routes in selected])
+    daysGo = np.array([[route.flightToGo.departure_date.toordinal() for route in routes] for routes in selected], dtype=np.int64)
+    daysBack = np.array([[route.flightBack.departure_date.toordinal() for route in routes] for routes in selected], dtype=np.int64)
+    stayovers = np.array([[route.flightToGo.stayovers + route.flightBack.stayovers for route in routes] for routes in selected], dtype=np.float64)
+
+    # date.weekday() from the ordinal: day 1 of the proleptic calendar was a Monday
+    weekdaysGo = (daysGo - 1) % 7
+    weekdaysBack = (daysBack - 1) % 7
+
+    totalCost = costs.sum(axis=1)
+    deltaBudget = np.abs(budgets - costs).sum(axis=1)
+    # sum of the gaps between sorted times == latest minus earliest
+    deltaTimeArrival = np.ptp(arrivals, axis=1)
+    deltaTimeBack = np.ptp(departuresBack, axis=1)
+    depaturesSuitability = ((weekdaysGo == 6).astype(np.int64) + np.isin(weekdaysBack, (4, 5))).sum(axis=1)
+    numStayovers = stayovers.sum(axis=1)
+    deltaDays = (np.abs((daysBack - daysGo) - daysSelected) * 24 * 3600).sum(axis=1).astype(np.float64)
+
+    # Normalization, as in evaluate_individual
+    totalCost /= 1000 * numTravellers
+    deltaBudget /= 500 * numTravellers
+    deltaTimeArrival /= 3600 * 24 * numTravellers
+    deltaTimeBack /= 3600 * 24 * numTravellers
+    depaturesSuitability = depaturesSuitability / (numTravellers * 2)
+    numStayovers /= numTravellers * 2
+    deltaDays /= numTravellers * 2
+
+    penalization = (
+        totalCost
+        + deltaBudget
+        + deltaTimeArrival * DELTA_TIME_PENALTY
+        + deltaTimeBack * DELTA_TIME_PENALTY
+        + depaturesSuitability
+        + numStayovers
+        + deltaDays
+    )
+    return [(float(score), ) for score in penalization]
@@ -0,0 +1,207 @@
+""" Exact planner: the provably best Trip under the same objective as GeneticAlgorithm.evaluate_individual.
+Once the destination is fixed, every penalty term but the two time deltas depends on a single traveller,
+so each (flightToGo, flightBack) option gets a per-traveller score and the search only has to
+branch over the arrival and departure spreads. Branch and bound over the options sorted by score,
+pruned with the lower bound: partial score + best score of every remaining traveller + current spreads """
+
+from src.ga.ga_engine import GeneticAlgorithm, NO_DESTINATION_MESSAGE
+from src.ga.evaluation import EPOCH, DELTA_TIME_PENALTY
+from src.ga.plan import PotentialRoutes, Traveller, Trip
+from deap import creator
+from typing import NamedTuple
+import numpy as np
+import threading
+import time
+
+class RouteOptions(NamedTuple):
+    """ Every (flightToGo, flightBack) pair of one traveller, sorted by score """
+    genes: np.ndarray # (goIndex, backIndex) into the route table
+    scores: np.ndarray # penalty terms that only depend on this traveller
+    arrivals: np.ndarray # seconds since EPOCH
+    departures: np.ndarray
+
+def routeOptions(routes: list[PotentialRoutes], traveller: Traveller, days: int, numTravellers: int) -> RouteOptions:
+    genes, costs, badDepartures, stayovers, deltaDays, arrivals, departures = [], [], [], [], [], [], []
+    for goIndex, route in enumerate(routes):
+        go = route.flightToGo
+        for backIndex, back in enumerate(route.flightsBack):
+            genes.append((goIndex, backIndex))
+            costs.append(go.price_eur + back.price_eur)
+            badDepartures.append((go.departure_date.weekday() == 6) + (back.departure_date.weekday() in (4, 5)))
+            stayovers.append(go.stayovers + back.stayovers)
+            deltaDays.append(abs((back.departure_date - go.departure_date).days - days) * 24 * 3600)
+            arrivals.append((go.arrival_time_local - EPOCH).total_seconds())
+            departures.append((back.departure_time_local - EPOCH).total_seconds())
+
+    costs = np.array(costs, dtype=np.float64)
+    scores = (
+        costs / (1000 * numTravellers)
+        + np.abs(traveller.budget - costs) / (500 * numTravellers)
+        + np.array(badDepartures) / (numTravellers * 2)
+        + np.array(stayovers) / (numTravellers * 2)
+        + np.array(deltaDays, dtype=np.float64) / (numTravellers * 2)
+    )
+    arrivals = np.array(arrivals)
+    departures = np.array(departures)
+
+    # options landing and leaving at the same times only differ by their score: keep the best one
+    order = np.lexsort((scores, departures, arrivals))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (np.diff(arrivals[order]) != 0) | (np.diff(departures[order]) != 0)
+    kept = order[first]
+    kept = kept[np.argsort(scores[kept], kind="stable")]
+
+    return RouteOptions(
+        genes=np.array(genes, dtype=np.int64).reshape(-1, 2)[kept],
+        scores=scores[kept],
+        arrivals=arrivals[kept],
+        departures=departures[kept]
+    )
+
+class ExactSolver:
+    def __init__(self, travellersTemplate, travelPlan, flightEngine, routeCacheSize=256, timeBudget: float = None):
+        """ Same progress interface as GeneticAlgorithm.run.
+        timeBudget: seconds after which the best plan found so far is returned, without optimality proof """
+        self.travellersTemplate = travellersTemplate
+        self.travelPlan = travelPlan
+        self.flightEngine = flightEngine
+        self.timeBudget = timeBudget
+        self.stopReason = None
+        self.deadline = None
+        self.timedOut = False
+        self.nodes = 0
+        self.cancelled = threading.Event()
+        self.best = None
+
+        # route cache, feasibility, scoring and printing are the GA's
+        self.gaEngine = GeneticAlgorithm(travellersTemplate, travelPlan, flightEngine, routeCacheSize=routeCacheSize)
+        self.timePenalty = DELTA_TIME_PENALTY / (3600 * 24 * len(travellersTemplate))
+
+    def _expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def _search(self, options: list[RouteOptions], restBounds: list[float], level: int, partial: float,
+                lowArrival: float, highArrival: float, lowDeparture: float, highDeparture: float,
+                chosen: list[int], best: list):
+        """ best: [score, chosen option per traveller], updated in place """
+        current = options[level]
+        if level == len(options) - 1:
+            # last traveller: all of its options at once
+            spread = (
+                np.maximum(highArrival, current.arrivals) - np.minimum(lowArrival, current.arrivals)
+                + np.maximum(highDeparture, current.departures) - np.minimum(lowDeparture, current.departures)
+            )
+            totals = partial + current.scores + self.timePenalty * spread
+            i = int(np.argmin(totals))
+            self.nodes += len(totals)
+            if totals[i] < best[0]:
+                best[0] = float(totals[i])
+                best[1] = chosen + [i]
+            return
+
+        currentSpread = (highArrival - lowArrival) + (highDeparture - lowDeparture) if chosen else 0.0
+        for i in range(len(current.scores)):
+            self.nodes += 1
+            bound = partial + current.scores[i] + restBounds[level + 1]
+            if bound + self.timePenalty * currentSpread >= best[0]:
+                break # options are sorted by score: none of the next ones can do better
+            arrival, departure = current.arrivals[i], current.departures[i]
+            newLowArrival, newHighArrival = min(lowArrival, arrival), max(highArrival, arrival)
+            newLowDeparture, newHighDeparture = min(lowDeparture, departure), max(highDeparture, departure)
+            spread = (newHighArrival - newLowArrival) + (newHighDeparture - newLowDeparture)
+            if bound + self.timePenalty * spread >= best[0]:
+                continue
+            # any incumbent, from this destination or an earlier one, is enough to give up on time
+            if self.cancelled.is_set() or (best[0] < np.inf and self._expired()):
+                self.timedOut = True
+                return
+            self._search(
+                options, restBounds, level + 1, partial + current.scores[i],
+                newLowArrival, newHighArrival, newLowDeparture, newHighDeparture,
+                chosen + [i], best
+            )
+
+    def destinationOptions(self, routeTables: list[list[PotentialRoutes]]) -> list[RouteOptions]:
+        numTravellers = len(self.travellersTemplate)
+        return [
+            routeOptions(routes, traveller, self.travelPlan.days, numTravellers)
+            for routes, traveller in zip(routeTables, self.travellersTemplate)
+        ]
+
+    @staticmethod
+    def destinationBound(options: list[RouteOptions]) -> float:
+        """ Lower bound of a destination: every traveller on its best option, no time spread """
+        return sum(float(option.scores[0]) for option in options)
+
+    def solveDestination(self, options: list[RouteOptions], incumbent: float = float("inf")):
+        """ Best genome for one destination, None when nothing beats the incumbent score """
+        numTravellers = len(options)
+        # the last level is vectorized: the traveller with the most options goes there
+        order = sorted(range(numTravellers), key=lambda i: len(options[i].scores))
+        ordered = [options[i] for i in order]
+        restBounds = list(np.cumsum([float(option.scores[0]) for option in ordered][::-1])[::-1]) + [0.0]
+
+        best = [incumbent, None]
+        self._search(ordered, restBounds, 0, 0.0, np.inf, -np.inf, np.inf, -np.inf, [], best)
+        if best[1] is None:
+            return None
+
+        genome = [None] * numTravellers
+        for traveller, i in zip(order, best[1]):
+            goIndex, backIndex = options[traveller].genes[i]
+            genome[traveller] = (int(goIndex), int(backIndex))
+        return genome
+
+    async def aprefetch_routes(self):
+        await self.gaEngine.aprefetch_routes()
+
+    def _individual(self, destination: str) -> Trip:
+        individual = creator.Individual(travellers=self.travellersTemplate, plan=self.travelPlan, destination=destination)
+        individual.createPotentialRoutes(self.travelPlan, self.flightEngine, self.gaEngine.routeCache)
+        return individual
+
+    def run(self):
+        """ Yields an update every time a better plan is found, then the final plan """
+        self.deadline = time.monotonic() + self.timeBudget if self.timeBudget else None
+        self.nodes = 0
+        self.timedOut = False
+
+        candidates = [self._individual(destination) for destination in self.gaEngine.get_feasibility().feasibleDestinations]
+        candidates = [individual for individual in candidates if individual.hasRoutes()]
+        if not candidates:
+            yield NO_DESTINATION_MESSAGE
+            return
+
+        # most promising destinations first, so the incumbent prunes the rest early
+        options = {individual.chosenDestination: self.destinationOptions(individual.routeTables) for individual in candidates}
+        bounds = {destination: self.destinationBound(tables) for destination, tables in options.items()}
+        candidates.sort(key=lambda individual: bounds[individual.chosenDestination])
+
+        best = None
+        explored = 0
+        for individual in candidates:
+            if best is not None and bounds[individual.chosenDestination] >= best.fitness.values[0]:
+                break
+            if self.cancelled.is_set() or (best is not None and self._expired()):
+                self.timedOut = True
+                break
+            genome = self.solveDestination(options[individual.chosenDestination], best.fitness.values[0] if best else float("inf"))
+            explored += 1
+            if genome is not None:
+                individual.genome = genome
+                individual.fitness.values = self.gaEngine.evaluate_individual(individual)
+                best = individual
+                yield f"\nDestination {individual.chosenDestination}" + self.gaEngine.printIndividual(explored - 1, best)
+            if self.timedOut:
+                break
+
+        if self.timedOut:
+            self.stopReason = f"time budget of {self.timeBudget:g}s reached, best plan found so far"
+        else:
+            self.stopReason = f"optimal, {explored} of {len(candidates)} destinations searched, {self.nodes} options scored"
+        if self.cancelled.is_set():
+            self.stopReason = "cancelled"
+            return
+        self.gaEngine.stopReason = self.stopReason
+        self.best = best
+        yield self.gaEngine.printIndividual(-1, best)
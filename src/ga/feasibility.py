@@ -0,0 +1,46 @@
+""" Origin x destination feasibility of a TravelPlan, built once per plan.
+For every pair it keeps the number of valid round trips and the cheapest one, so the GA only
+samples destinations every traveller can actually reach """
+
+from src.ga.cache import RouteCache
+import numpy as np
+import random
+
+class FeasibilityIndex:
+    def __init__(self, origins: list[str], destinations: list[str], counts: np.ndarray, minPrices: np.ndarray):
+        self.origins = origins
+        self.destinations = destinations
+        self.counts = counts # (origins x destinations) number of (flightToGo, flightBack) pairs
+        self.minPrices = minPrices # (origins x destinations) cheapest round trip, inf when none
+
+        feasible = (counts > 0).all(axis=0)
+        self.feasibleDestinations = [destination for destination, ok in zip(destinations, feasible) if ok]
+        # cheaper destinations for the whole group are drawn more often
+        groupPrices = minPrices.sum(axis=0)[feasible]
+        self.weights = (1 / np.maximum(groupPrices, 1)).tolist()
+
+    @classmethod
+    def build(cls, travellers: list, plan, flightEngine, routeCache: RouteCache):
+        origins = list(dict.fromkeys(traveller.origin for traveller in travellers))
+        destinations = list(dict.fromkeys(plan.availableDestinations or []))
+
+        counts = np.zeros((len(origins), len(destinations)), dtype=np.int64)
+        minPrices = np.full((len(origins), len(destinations)), np.inf)
+        for i, origin in enumerate(origins):
+            for j, destination in enumerate(destinations):
+                routes = routeCache.getRoutes(origin, destination, plan, flightEngine)
+                if routes:
+                    counts[i, j] = sum(len(route.flightsBack) for route in routes)
+                    minPrices[i, j] = min(
+                        route.flightToGo.price_eur + min(flight.price_eur for flight in route.flightsBack)
+                        for route in routes
+                    )
+        return cls(origins, destinations, counts, minPrices)
+
+    def isFeasible(self, destination: str) -> bool:
+        return destination in self.feasibleDestinations
+
+    def sampleDestination(self, weighted: bool = False) -> str:
+        if weighted:
+            return random.choices(self.feasibleDestinations, weights=self.weights)[0]
+        return random.choice(self.feasibleDestinations)
@@ -9,16 +9,47 @@ from deap import base, creator, tools
 import random
 from src.ga.plan import *
 from src.flightSearcher import FlightEngine
+from src.ga.cache import RouteCache, EvaluationCache
+from src.ga.evaluation import evaluatePopulation
+from src.ga.feasibility import FeasibilityIndex
+from src.ga.stopping import StoppingCriteria
+from src.ga.parallel import getPool, chunk, buildRoutes, evaluateChunk
 import multiprocessing
 from functools import partial
+import threading
 import asyncio
+from src import metrics
+
+NO_DESTINATION_MESSAGE = "I could not find flights to any of the destinations for every traveller within those dates and budget."
+
+GENERATION_SECONDS = metrics.histogram("ga_generation_seconds", "Time of one GA generation")
+EVALUATIONS = metrics.counter("ga_evaluations_total", "Individuals scored (cache misses of the evaluation cache)")
+EVALUATION_SECONDS = metrics.histogram("ga_evaluation_seconds", "Time to score one batch of individuals")
 
 # Individual
 creator.create("FitnessMin", base.Fitness, weights=(-1.0,))
 creator.create("Individual", Trip, fitness=creator.FitnessMin)
 
 class GeneticAlgorithm:
-    def __init__(self, travellersTemplate, travelPlan, flightEngine, populationSize=5, ngen=5, probCrossover=0.8, probMutate=0.3):
+    def __init__(
+            self,
+            travellersTemplate,
+            travelPlan,
+            flightEngine,
+            populationSize=5,
+            ngen=5,
+            probCrossover=0.8,
+            probMutate=0.3,
+            routeCacheSize=256,
+            batchEvaluation=True,
+            parallel=False,
+            processes=None,
+            weightDestinations=False,
+            stopping: StoppingCriteria = None,
+            evaluationCacheSize=4096,
+            seeders: list = None,
+            seedFraction=0.2
+        ):
         self.populationSize = populationSize
         self.ngen = ngen
         self.travellersTemplate = travellersTemplate
@@ -28,6 +59,26 @@ class GeneticAlgorithm:
         self.coefProbCrossover = probCrossover
         self.coefProbMutate = probMutate
 
+        # TravelPlan does not change along the run: routes to a destination are built once and shared
+        self.routeCache = RouteCache(maxSize=routeCacheSize)
+        # score the whole population in one vectorized pass instead of one Trip at a time
+        self.batchEvaluation = batchEvaluation
+        # offspring often repeat genomes already scored: their fitness is reused
+        self.evaluationCache = EvaluationCache(maxSize=evaluationCacheSize)
+        # origin x destination feasibility, built on the first individual
+        self.feasibility = None
+        self.weightDestinations = weightDestinations
+
+        # without criteria the run lasts exactly ngen generations
+        self.stopping = stopping or StoppingCriteria()
+        self.stopReason = None
+        # src.ga.seeders: part of the initial population comes from heuristics instead of random picks
+        self.seeders = seeders or []
+        self.seedFraction = seedFraction
+        self.best = None # best individual of the last run
+        # set from any thread: the run stops before its next generation
+        self.cancelled = threading.Event()
+
         self.toolbox = base.Toolbox()
         self.toolbox.register("individual", partial(self.create_individual, self.flightEngine))
         self.toolbox.register("evaluate", self.evaluate_individual)
@@ -35,20 +86,61 @@ class GeneticAlgorithm:
         self.toolbox.register("mutate", self.mutate_individual)
         self.toolbox.register("select", tools.selTournament, tournsize=5)
 
+        # opt-in: route building and evaluation in a pool of worker processes, each with its own FlightEngine
+        self.pool = None
+        if parallel:
+            self.processes = processes or multiprocessing.cpu_count()
+            self.pool = getPool(flightEngine, self.processes, routeCacheSize)
+            self.datasetVersion = flightEngine.datasetVersion() # workers serve the run from this version
+            self.toolbox.register("map", self.pool.map)
+
+    def get_feasibility(self) -> FeasibilityIndex:
+        if self.feasibility is None:
+            self.feasibility = FeasibilityIndex.build(self.travellersTemplate, self.travelPlan, self.flightEngine, self.routeCache)
+        return self.feasibility
+
     def create_individual(self, flightEngine: FlightEngine):
+        feasibility = self.get_feasibility()
+        if not feasibility.feasibleDestinations:
+            return None # no destination is reachable by every traveller
+
         individual = creator.Individual(
             travellers=self.travellersTemplate,
-            plan=self.travelPlan
+            plan=self.travelPlan,
+            destination=feasibility.sampleDestination(self.weightDestinations)
         )
 
-        individual.createPotentialRoutes(plan=self.travelPlan, flightEngine=flightEngine)
-        if any(not traveller.potentialRoutes for traveller in individual.travellers):
+        individual.createPotentialRoutes(plan=self.travelPlan, flightEngine=flightEngine, routeCache=self.routeCache)
+        if not individual.hasRoutes():
             return None # there is no flight to the chosen destination for at least one traveller
         individual.selectRoutes()
         return individual
 
+    def individual_for(self, destination: str) -> Trip:
+        """ Individual with the route tables of the destination and an empty genome """
+        individual = creator.Individual(travellers=self.travellersTemplate, plan=self.travelPlan, destination=destination)
+        individual.createPotentialRoutes(plan=self.travelPlan, flightEngine=self.flightEngine, routeCache=self.routeCache)
+        return individual
+
+    def seed_individual(self, destination: str, flightIds: list[tuple[int, int]]) -> Trip:
+        """ Individual flying the given (flightToGo id, flightBack id) per traveller.
+        None when the destination or one of the flights is not among the routes of this plan """
+        if not self.get_feasibility().isFeasible(destination):
+            return None
+        individual = self.individual_for(destination)
+        for routes, (goId, backId) in zip(individual.routeTables, flightIds):
+            gene = next((
+                (goIndex, backIndex)
+                for goIndex, route in enumerate(routes) if route.flightToGo.id == goId
+                for backIndex, flightBack in enumerate(route.flightsBack) if flightBack.id == backId
+            ), None)
+            if gene is None:
+                return None
+            individual.genome.append(gene)
+        return individual
+
     def evaluate_individual(self, individual: Trip) -> tuple[float]:
-        totalCost = sum(traveller.selectedRoute.cost for traveller in individual.travellers)
+        totalCost = sum(route.cost for route in individual.selectedRoutes())
         deltaBudget = individual.deltaBudget()
         deltaTimeArrival = individual.deltaTime(arrival=True)
         deltaTimeBack = individual.deltaTime(arrival=False)
@@ -90,20 +182,45 @@ class GeneticAlgorithm:
 
         return (penalization, )
 
+    def evaluate_population(self, individuals: list[Trip]) -> list[tuple[float]]:
+        keys = [individual.genomeKey() for individual in individuals]
+        fitnesses = [self.evaluationCache.get(key) for key in keys]
+
+        pending = {} # genome key -> first individual carrying it
+        for key, fitness, individual in zip(keys, fitnesses, individuals):
+            if fitness is None and key not in pending:
+                pending[key] = individual
+
+        computed = dict(zip(pending, self.score_individuals(list(pending.values()))))
+        for key, fitness in computed.items():
+            self.evaluationCache.put(key, fitness)
+
+        return [fitness if fitness is not None else computed[key] for key, fitness in zip(keys, fitnesses)]
+
+    def score_individuals(self, individuals: list[Trip]) -> list[tuple[float]]:
+        EVALUATIONS.inc(len(individuals))
+        with EVALUATION_SECONDS.time():
+            return self._score_individuals(individuals)
+
+    def _score_individuals(self, individuals: list[Trip]) -> list[tuple[float]]:
+        if self.pool is not None and individuals:
+            # individuals travel without their route tables, workers attach their own
+            tasks = [(individuals, self.travelPlan.days, self.datasetVersion) for individuals in chunk(individuals, self.processes)]
+            return [fitness for fitnesses in self.toolbox.map(evaluateChunk, tasks) for fitness in fitnesses]
+        if self.batchEvaluation:
+            return evaluatePopulation(individuals, self.travelPlan.days)
+        return list(map(self.toolbox.evaluate, individuals))
+
     def mate_individuals(self, individual1: Trip, individual2: Trip):
-        """Swap the chosen destination from two individuals and recalculate potential routes 
+        """Swap the chosen destination from two individuals, together with their route tables.
         From the potential routes select from scratch the routes. It's not the traditional mating
         however, since all travellers must have the same destination it's not possible to
         swap travellers from individuals """
-        tempDestination = individual1.chosenDestination
-
-        individual1.chosenDestination = individual2.chosenDestination
-        individual2.chosenDestination = tempDestination
+        individual1.chosenDestination, individual2.chosenDestination = individual2.chosenDestination, individual1.chosenDestination
+        # route tables are shared and immutable: swapping the pointers is enough
+        individual1.routeTables, individual2.routeTables = individual2.routeTables, individual1.routeTables
 
-        individual1.createPotentialRoutes(self.travelPlan, self.flightEngine)
         individual1.selectRoutes()
-
-        individual2.createPotentialRoutes(self.travelPlan, self.flightEngine)
         individual2.selectRoutes()
 
         return individual1, individual2
@@ -111,85 +228,159 @@ class GeneticAlgorithm:
     def mutate_individual(self, individual: Trip, coef_prob: float = 0.2):
         """ Randomly mutate an individual's selected routes 
         Takes a different potential route, and regenerates the flight to go and the flight to come back """
-        for traveller in individual.travellers:
-            newPotentialRoute = random.choice(traveller.potentialRoutes)
-            if newPotentialRoute.flightsBack:
-                newRoute = Route(
-                    flightToGo=newPotentialRoute.flightToGo,
-                    flightBack=random.choice(newPotentialRoute.flightsBack)
-                )
-                newRoute.cost = newRoute.flightToGo.price_eur + newRoute.flightBack.price_eur
-                traveller.selectedRoute = newRoute
+        for i, routes in enumerate(individual.routeTables):
+            individual.genome[i] = Trip.randomGene(routes)
         return (individual,) # DEAP expects mutation functions to return a tuple of individuals
         # internally DEAP is built to handle pipelines where the operators are chained, and all operators return tuples for consistency 
 
-    def run(self):
-        bestInvididualsScore = []
-        population = []
-
-        for _ in range(self.populationSize):
+    def prefetch_routes(self):
+        """ Build the route tables of every (origin, destination) pair in the worker processes """
+        origins = list(dict.fromkeys(traveller.origin for traveller in self.travellersTemplate))
+        tasks = [
+            (origin, destination, self.travelPlan, self.datasetVersion)
+            for destination in self.travelPlan.availableDestinations
+            for origin in origins
+            if RouteCache.key(origin, destination, self.travelPlan) not in self.routeCache
+        ]
+        for (origin, destination, plan, _), routes in zip(tasks, self.toolbox.map(buildRoutes, tasks)):
+            self.routeCache.fill(RouteCache.key(origin, destination, plan), routes)
+
+    async def aprefetch_routes(self):
+        """ Fill the route cache with concurrent queries on the pooled async engine,
+        meant to be awaited by the server before the run starts """
+        origins = list(dict.fromkeys(traveller.origin for traveller in self.travellersTemplate))
+        keys = [
+            (origin, destination)
+            for destination in self.travelPlan.availableDestinations
+            for origin in origins
+            if RouteCache.key(origin, destination, self.travelPlan) not in self.routeCache
+        ]
+        tables = await asyncio.gather(*(
+            self.travelPlan.acreateRoutes(origin, destination, self.flightEngine) for origin, destination in keys
+        ))
+        for (origin, destination), routes in zip(keys, tables):
+            self.routeCache.fill(RouteCache.key(origin, destination, self.travelPlan), routes)
+
+    def create_population(self) -> list[Trip]:
+        if self.pool is not None:
+            self.prefetch_routes()
+
+        population = self.seed_population()
+
+        for _ in range(self.populationSize - len(population)):
             individual = self.toolbox.individual()
             if individual:
                 population.append(individual)
+        return population
+
+    def seed_population(self) -> list[Trip]:
+        """ seedFraction of the population from the seeders, in order, without duplicate genomes """
+        quota = min(self.populationSize, round(self.populationSize * self.seedFraction))
+        population = []
+        seen = set()
+        for seeder in self.seeders:
+            if len(population) >= quota:
+                break
+            for individual in seeder.seed(self, quota - len(population)):
+                key = individual.genomeKey()
+                if key not in seen:
+                    seen.add(key)
+                    population.append(individual)
+        return population[:quota]
+
+    def initialize_population(self) -> list[Trip]:
+        population = self.create_population()
 
         # first evaluation: to get the elite
-        fitnesses = map(self.toolbox.evaluate, population)
+        fitnesses = self.evaluate_population(population)
         for individual, fit in zip(population, fitnesses):
             individual.fitness.values = fit
-        
-        for gen in range(self.ngen):
-            offspring = self.toolbox.select(population, len(population))
-            offspring = list(map(self.toolbox.clone, offspring))
-
-            elite = tools.selBest(population, 1)[0]
-
-            # apply crossover (mate) and mutation
-            for child1, child2 in zip(offspring[::2], offspring[1::2]):
-                if random.random() < self.coefProbCrossover:
-                    self.toolbox.mate(child1, child2)
-                    del child1.fitness.values
-                    del child2.fitness.values
-                
-            for mutant in offspring:
-                if random.random() < self.coefProbMutate:
-                    self.toolbox.mutate(mutant)
-                    del mutant.fitness.values
+        self.evaluationCache.markGeneration() # generationStats[0] is the initial population
+        return population
+
+    def evolve(self, population: list[Trip]) -> list[Trip]:
+        """ One generation: selection, crossover, mutation, evaluation and elitism """
+        with GENERATION_SECONDS.time():
+            return self._evolve(population)
+
+    def _evolve(self, population: list[Trip]) -> list[Trip]:
+        offspring = self.toolbox.select(population, len(population))
+        offspring = list(map(self.toolbox.clone, offspring))
+
+        elite = tools.selBest(population, 1)[0]
+
+        # apply crossover (mate) and mutation
+        for child1, child2 in zip(offspring[::2], offspring[1::2]):
+            if random.random() < self.coefProbCrossover:
+                self.toolbox.mate(child1, child2)
+                del child1.fitness.values
+                del child2.fitness.values
             
-            # reevaluate individuals with invalid fitness (those that suffered a modification)
-            invalidIndividuals = [individual for individual in offspring if not individual.fitness.valid]
-            fitnesses = map(self.toolbox.evaluate, invalidIndividuals)
+        for mutant in offspring:
+            if random.random() < self.coefProbMutate:
+                self.toolbox.mutate(mutant)
+                del mutant.fitness.values
+        
+        # reevaluate individuals with invalid fitness (those that suffered a modification)
+        invalidIndividuals = [individual for individual in offspring if not individual.fitness.valid]
+        fitnesses = self.evaluate_population(invalidIndividuals)
 
-            for individual, fit in zip(invalidIndividuals, fitnesses):
-                individual.fitness.values = fit
-            
-            # After all modifications, replace worst with elite, to keep the best individual from previous generation
-            worst = tools.selWorst(offspring, 1)[0]
-            idx = offspring.index(worst)
-            offspring[idx] = self.toolbox.clone(elite)
+        for individual, fit in zip(invalidIndividuals, fitnesses):
+            individual.fitness.values = fit
+        self.evaluationCache.markGeneration()
+        
+        # After all modifications, replace worst with elite, to keep the best individual from previous generation
+        worst = tools.selWorst(offspring, 1)[0]
+        idx = offspring.index(worst)
+        offspring[idx] = self.toolbox.clone(elite)
 
-            population[:] = offspring
+        return offspring
+
+    def run(self):
+        bestInvididualsScore = []
+        self.stopping.start()
+        population = self.initialize_population()
+        if not population:
+            yield NO_DESTINATION_MESSAGE
+            return
+        
+        for gen in range(self.ngen):
+            if self.cancelled.is_set():
+                self.stopReason = "cancelled"
+                return
+            population[:] = self.evolve(population)
 
             best = tools.selBest(population, 1)[0]
             yield self.printIndividual(gen, best)
 
+            self.stopReason = self.stopping.check(best.fitness.values[0], population)
+            if self.stopReason:
+                break
+        else:
+            self.stopReason = f"all {self.ngen} generations completed"
+
+        self.best = best
         yield self.printIndividual(-1, best)
 
     def printIndividual(self, generation, individual):
         if generation == -1:
-            headerMessage = f"Best store along all the generations: {individual.fitness.values[0]}.\nThis is my suggested trip plan:\n"
+            headerMessage = f"Best store along all the generations: {individual.fitness.values[0]}.\n" \
+            f"Stopped: {self.stopReason}.\nThis is my suggested trip plan:\n"
         else:
             headerMessage = f"\nBest score of the generation {generation}: {individual.fitness.values[0]}"
         
         lines = [headerMessage]
 
-        for i, traveller in enumerate(individual.travellers, start=1):
+        for i, (traveller, route) in enumerate(zip(individual.travellers, individual.selectedRoutes()), start=1):
             lines.append(f"Traveller {i}:")
             lines.append(f"  Origin: {traveller.origin}")
             lines.append(f"  Budget: €{traveller.budget:.2f}")
 
-            if traveller.selectedRoute:
-                to = traveller.selectedRoute.flightToGo
-                back = traveller.selectedRoute.flightBack
+            if route:
+                to = route.flightToGo
+                back = route.flightBack
+                if generation == -1: # the final plan goes out as validated Flight models
+                    to, back = to.toFlight(), back.toFlight()
 
                 lines.extend([
                     "  Outbound Flight:",
@@ -200,12 +391,42 @@ class GeneticAlgorithm:
                     f"    {back.from_city} → {back.to_city}",
                     f"    Date: {back.departure_date} | Departure: {back.departure_time_local.time()} | Arrival: {back.arrival_time_local.time()}",
                     f"    Price: €{back.price_eur:.2f} | Stayovers: {back.stayovers} | Flight: {back.flight_number} | Duration: {back.duration_hours}h",
-                    f"  Total Route Cost: €{traveller.selectedRoute.cost:.2f}\n"
+                    f"  Total Route Cost: €{route.cost:.2f}\n"
                 ])
 
         return "\n".join(lines)
 
-# Adjusting run so that it's async. It allows to yield/iterate over asynchronously
-async def run_ga_generator(ga_engine):
-    for update in await asyncio.to_thread(lambda: ga_engine.run()):
-        yield update
\ No newline at end of file
+async def run_ga_generator(ga_engine, executor=None):
+    """ Iterates ga_engine.run() in a worker thread (of executor, default the loop's), the updates reach
+    the event loop through a queue. Leaving the async for early (or closing the generator) cancels the
+    run at its next generation """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    end = object()
+
+    def produce():
+        try:
+            for update in ga_engine.run():
+                loop.call_soon_threadsafe(queue.put_nowait, update)
+                if ga_engine.cancelled.is_set():
+                    break
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, end)
+
+    loop.run_in_executor(executor, produce)
+    finished = False
+    try:
+        while True:
+            item = await queue.get()
+            if item is end:
+                finished = True
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        if not finished:
+            # the thread is not awaited: it notices the flag within a generation and exits on its own
+            ga_engine.cancelled.set()
\ No newline at end of file
@@ -0,0 +1,155 @@
+""" Island model: several GeneticAlgorithm populations evolving in separate processes.
+Islands can start from different subsets of the destinations, and every few generations their
+best individuals migrate to the next island of the ring """
+
+from deap import tools
+from src.flightSearcher import FlightEngine
+from src.ga.ga_engine import GeneticAlgorithm, NO_DESTINATION_MESSAGE
+from queue import Empty
+import multiprocessing
+import threading
+import random
+import copy
+
+def _runIsland(index: int, travellers: list, plan, databaseName: str, backend: str, options: dict,
+               seed, migrationInterval: int, migrants: int, inbox, outbox, progress):
+    """ Island process: evolves its own population and reports its best individual every generation """
+    try:
+        if seed is not None:
+            random.seed(seed + index)
+        flightEngine = FlightEngine(databaseName, applyMigrations=False, backend=backend)
+        gaEngine = GeneticAlgorithm(travellersTemplate=travellers, travelPlan=plan, flightEngine=flightEngine, **options)
+
+        gaEngine.stopping.start()
+        population = gaEngine.initialize_population()
+        if not population:
+            progress.put(("done", index, "no feasible destination"))
+            return
+
+        for gen in range(gaEngine.ngen):
+            population[:] = gaEngine.evolve(population)
+
+            if (gen + 1) % migrationInterval == 0:
+                for migrant in tools.selBest(population, migrants):
+                    outbox.put(migrant)
+                try:
+                    while True:
+                        immigrant = inbox.get_nowait()
+                        # route tables stay in the sender process: attach ours, the fitness travels along
+                        immigrant.createPotentialRoutes(plan, flightEngine, gaEngine.routeCache)
+                        population[population.index(tools.selWorst(population, 1)[0])] = immigrant
+                except Empty:
+                    pass
+
+            best = tools.selBest(population, 1)[0]
+            progress.put(("generation", index, gen, best))
+
+            reason = gaEngine.stopping.check(best.fitness.values[0], population)
+            if reason:
+                progress.put(("done", index, reason))
+                return
+        progress.put(("done", index, f"all {gaEngine.ngen} generations completed"))
+    except Exception as e:
+        progress.put(("done", index, f"failed: {e!r}"))
+
+class IslandModel:
+    def __init__(
+            self,
+            travellersTemplate,
+            travelPlan,
+            flightEngine: FlightEngine,
+            islands: int = None,
+            migrationInterval: int = 2,
+            migrants: int = 1,
+            splitDestinations: bool = True,
+            seed: int = None,
+            **gaOptions
+        ):
+        """ gaOptions go to every island's GeneticAlgorithm (populationSize, ngen, stopping...)
+        splitDestinations: each island samples its initial population from its own share of the destinations """
+        self.travellersTemplate = travellersTemplate
+        self.travelPlan = travelPlan
+        self.flightEngine = flightEngine
+        self.islands = islands or multiprocessing.cpu_count()
+        self.migrationInterval = migrationInterval
+        self.migrants = migrants
+        self.splitDestinations = splitDestinations
+        self.seed = seed
+        self.gaOptions = gaOptions
+        self.cancelled = threading.Event()
+        self.best = None
+
+        # local engine: attaches route tables to the reported individuals and prints them
+        self.gaEngine = GeneticAlgorithm(travellersTemplate, travelPlan, flightEngine)
+
+    def islandPlans(self) -> list:
+        destinations = self.travelPlan.availableDestinations or []
+        if not self.splitDestinations or len(destinations) < self.islands:
+            return [self.travelPlan] * self.islands
+
+        plans = []
+        for i in range(self.islands):
+            plan = copy.copy(self.travelPlan)
+            plan.availableDestinations = destinations[i::self.islands]
+            plans.append(plan)
+        return plans
+
+    def run(self):
+        """ Same progress interface as GeneticAlgorithm.run: an update every time the best individual
+        across all islands improves, then the final plan """
+        context = multiprocessing.get_context("spawn")
+        progress = context.Queue()
+        inboxes = [context.Queue() for _ in range(self.islands)]
+
+        processes = [
+            context.Process(
+                target=_runIsland,
+                args=(
+                    i, self.travellersTemplate, plan, self.flightEngine.databaseName, self.flightEngine.backend,
+                    self.gaOptions, self.seed, self.migrationInterval, self.migrants,
+                    inboxes[i], inboxes[(i + 1) % self.islands], progress
+                ),
+                daemon=True
+            )
+            for i, plan in enumerate(self.islandPlans())
+        ]
+        for process in processes:
+            process.start()
+
+        best = None
+        reasons = {}
+        try:
+            while len(reasons) < self.islands:
+                if self.cancelled.is_set():
+                    return # the finally below stops the islands
+                try:
+                    message = progress.get(timeout=0.5)
+                except Empty:
+                    # an island killed before reporting (crash, OOM kill) would be waited for forever
+                    for i, process in enumerate(processes):
+                        if i not in reasons and process.exitcode is not None:
+                            reasons[i] = f"exited with code {process.exitcode} before finishing"
+                    continue
+                if message[0] == "done":
+                    _, index, reason = message
+                    reasons[index] = reason
+                    continue
+
+                _, index, gen, individual = message
+                if best is None or individual.fitness.values[0] < best.fitness.values[0]:
+                    individual.createPotentialRoutes(self.travelPlan, self.flightEngine, self.gaEngine.routeCache)
+                    best = individual
+                    yield f"\nIsland {index}" + self.gaEngine.printIndividual(gen, best)
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+
+        self.gaEngine.stopReason = "; ".join(f"island {i}: {reasons[i]}" for i in sorted(reasons))
+        if best is None:
+            yield NO_DESTINATION_MESSAGE
+            return
+
+        self.best = best
+        yield self.gaEngine.printIndividual(-1, best)
@@ -0,0 +1,77 @@
+""" Process pool for GeneticAlgorithm.
+Every worker opens its own read-only FlightEngine and keeps its own route cache, pools are
+kept alive and reused across generations and requests. Tasks carry the dataset version of the run: a worker
+holding routes of another version drops them, and a worker that cannot read that version fails the task,
+genomes index route tables built from the run's version and would point into the wrong flights """
+
+from src.flightSearcher import FlightEngine
+from src.ga.cache import RouteCache
+from src.ga.evaluation import evaluatePopulation
+import multiprocessing
+import math
+
+_pools = {} # (databaseName, backend, processes) -> Pool
+_worker = {} # state of the current worker process
+
+def _initWorker(databaseName: str, backend: str, routeCacheSize: int):
+    import src.ga.ga_engine # registers the DEAP creator classes, needed to unpickle individuals
+    _worker["flightEngine"] = FlightEngine(databaseName, applyMigrations=False, backend=backend)
+    _worker["routeCache"] = RouteCache(maxSize=routeCacheSize)
+    _worker["version"] = _servedVersion(_worker["flightEngine"])
+
+class DatasetChanged(RuntimeError):
+    pass
+
+def _servedVersion(flightEngine: FlightEngine) -> str:
+    # the columnar index answers from the version it was loaded at, SQL from the live table
+    return flightEngine.indexVersion if flightEngine.index is not None else flightEngine.datasetVersion()
+
+def _useDataset(version: str):
+    flightEngine = _worker["flightEngine"]
+    if flightEngine.index is not None and version != _worker["version"]:
+        flightEngine.reloadIndex()
+    served = _servedVersion(flightEngine)
+    if served != _worker["version"]:
+        _worker["routeCache"].clear()
+        _worker["version"] = served
+    if served != version:
+        raise DatasetChanged(f"The run uses flights version {version} but the database is at {served}: the flights changed during the run")
+
+def getPool(flightEngine: FlightEngine, processes: int = None, routeCacheSize: int = 256):
+    """ Pool of workers reading the same database as flightEngine, created on first use """
+    processes = processes or multiprocessing.cpu_count()
+    key = (flightEngine.databaseName, flightEngine.backend, processes)
+    if key not in _pools:
+        # spawn: forking the multi-threaded server process is not safe
+        context = multiprocessing.get_context("spawn")
+        _pools[key] = context.Pool(
+            processes=processes,
+            initializer=_initWorker,
+            initargs=(flightEngine.databaseName, flightEngine.backend, routeCacheSize)
+        )
+    return _pools[key]
+
+def shutdownPools():
+    for pool in _pools.values():
+        pool.close()
+        pool.join()
+    _pools.clear()
+
+def chunk(items: list, numChunks: int) -> list[list]:
+    """ Contiguous chunks, so results come back in the original order """
+    size = max(1, math.ceil(len(items) / numChunks))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def buildRoutes(task):
+    """ Worker: potential routes for one (origin, destination) pair """
+    originCity, destination, plan, version = task
+    _useDataset(version)
+    return _worker["routeCache"].getRoutes(originCity, destination, plan, _worker["flightEngine"])
+
+def evaluateChunk(task):
+    """ Worker: attach the route tables to the received individuals and score them """
+    individuals, daysSelected, version = task
+    _useDataset(version)
+    for individual in individuals:
+        individual.createPotentialRoutes(individual.plan, _worker["flightEngine"], _worker["routeCache"])
+    return evaluatePopulation(individuals, daysSelected)
@@ -1,26 +1,28 @@
-from src.flight import FlightSelection, Flight
+from src.flight import FlightSelection, FlightRecord
 from src.flightSearcher import FlightEngine
+from src.ga.cache import RouteCache
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, NamedTuple
 from datetime import date, timedelta
 import random
 import copy
-import time
+from src import metrics
 
-class PotentialRoutes(BaseModel):
-    flightToGo: Flight
-    flightsBack: list[Flight]
+ROUTE_BUILD_SECONDS = metrics.histogram("route_build_seconds", "Route table build time per (traveller origin, destination)")
 
-class Route(BaseModel):
-    flightToGo: Flight
-    flightBack: Flight
+# Plain tuples of FlightRecord: thousands of them are built per run, validation would dominate
+class PotentialRoutes(NamedTuple):
+    flightToGo: FlightRecord
+    flightsBack: list[FlightRecord]
+
+class Route(NamedTuple):
+    flightToGo: FlightRecord
+    flightBack: FlightRecord
     cost: Optional[float] = None
 
 class Traveller(BaseModel):
     origin: str
     budget: float = 0
-    potentialRoutes: Optional[list[PotentialRoutes]] = None
-    selectedRoute: Optional[Route] = None
 
 class TravelPlan:
     def __init__(
@@ -44,8 +46,19 @@ class TravelPlan:
         self.preferredCities = preferredCities
         self.availableDestinations = availableDestinations
 
-    def createRoutes(self, originCity: str, destination: str, flightEngine: FlightEngine) -> list[PotentialRoutes]:
-        trip = FlightSelection(
+    def constraintsKey(self) -> tuple:
+        """ Hashable summary of everything that shapes the routes of a traveller """
+        return (
+            self.fromDate,
+            self.toDate,
+            tuple(sorted(self.vetoCities)) if self.vetoCities else None,
+            self.priceMax,
+            self.days,
+            self.allowStayover
+        )
+
+    def _selection(self, originCity: str, destination: str) -> FlightSelection:
+        return FlightSelection(
             startDate=self.fromDate,
             endDate=self.toDate,
             priceMax=self.priceMax,
@@ -55,30 +68,29 @@ class TravelPlan:
             stayoversAllowed=self.allowStayover
         )
 
-        goingFlights = flightEngine.retrieveFlights(trip)
-        
+    @staticmethod
+    def _routesFrom(roundTrips) -> list[PotentialRoutes]:
         routes = []
-        for goingFlight in goingFlights:
-            trip = FlightSelection(
-                startDate=goingFlight.departure_date + timedelta(days=1),
-                endDate=goingFlight.departure_date + timedelta(days=self.days),
-                priceMax=self.priceMax - goingFlight.price_eur,
-                startCity=destination,
-                destinationCity=originCity,
-                stayoversAllowed=self.allowStayover
-            )
-
-            flightsBack = flightEngine.retrieveFlights(trip)
-
-            route = PotentialRoutes(
-                flightToGo=goingFlight,
-                flightsBack=flightsBack
-            )
-
+        for goingFlight, flightsBack in roundTrips:
             if flightsBack:
-                routes.append(route)
-
+                routes.append(PotentialRoutes(
+                    flightToGo=goingFlight,
+                    flightsBack=flightsBack
+                ))
         return routes
+
+    def createRoutes(self, originCity: str, destination: str, flightEngine: FlightEngine) -> list[PotentialRoutes]:
+        with ROUTE_BUILD_SECONDS.time():
+            # a single query for the outbound flights and another one for all the flights back
+            roundTrips = flightEngine.retrieveRoundTrips(self._selection(originCity, destination), self.days)
+            return self._routesFrom(roundTrips)
+
+    async def acreateRoutes(self, originCity: str, destination: str, flightEngine: FlightEngine) -> list[PotentialRoutes]:
+        # timed once a connection is ours: prefetching gathers more builds than the pool has connections
+        async with flightEngine.aconnect() as connection:
+            with ROUTE_BUILD_SECONDS.time():
+                roundTrips = await flightEngine.aretrieveRoundTrips(self._selection(originCity, destination), self.days, connection)
+                return self._routesFrom(roundTrips)
     
 class Plan(BaseModel):
     listTravellers: list[Traveller]
@@ -89,43 +101,87 @@ class Plan(BaseModel):
     }
 
 class Trip:
-    """ This is the Individual for the Genetic Algorithm """
-    def __init__(self, travellers: list[Traveller], plan: TravelPlan):
-        t0 = time.time()
-        self.travellers = copy.deepcopy(travellers)
-        print(f"Deepcopy took {time.time() - t0:.4f} seconds")
+    """ This is the Individual for the Genetic Algorithm
+    Its genome is the chosen destination plus one (flightToGo index, flightBack index) pair per traveller.
+    The indexes point into route tables shared by every individual of the run, never modified """
+    def __init__(self, travellers: list[Traveller], plan: TravelPlan, destination: str = None):
+        self.travellers = travellers # shared template, read only
+        self.plan = plan
         """ Generating routes here allows to fix the destination for all the travellers """
-        self.chosenDestination = random.choice(plan.availableDestinations)
-
-    def createPotentialRoutes(self, plan: TravelPlan, flightEngine: FlightEngine):
-        for traveller in self.travellers:
-            traveller.potentialRoutes = plan.createRoutes(
-                traveller.origin,
-                self.chosenDestination,
-                flightEngine
-            )
+        self.chosenDestination = destination or random.choice(plan.availableDestinations)
+        self.routeTables: list[list[PotentialRoutes]] = [] # one table per traveller
+        self.genome: list[tuple[int, int]] = []
+
+    def __deepcopy__(self, memo):
+        """ DEAP clones the offspring every generation: copy the genome and the fitness,
+        share the travellers and the route tables """
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone.genome = list(self.genome)
+        if "fitness" in self.__dict__:
+            clone.fitness = copy.deepcopy(self.fitness, memo)
+        return clone
+
+    def __getstate__(self):
+        """ Route tables stay behind when an individual is sent to another process,
+        the receiver attaches them again from its own route cache """
+        state = self.__dict__.copy()
+        state["routeTables"] = None
+        return state
+
+    def createPotentialRoutes(self, plan: TravelPlan, flightEngine: FlightEngine, routeCache: RouteCache = None):
+        if routeCache is not None:
+            self.routeTables = [
+                routeCache.getRoutes(traveller.origin, self.chosenDestination, plan, flightEngine)
+                for traveller in self.travellers
+            ]
+        else:
+            self.routeTables = [
+                plan.createRoutes(traveller.origin, self.chosenDestination, flightEngine)
+                for traveller in self.travellers
+            ]
+
+    def hasRoutes(self) -> bool:
+        return all(self.routeTables)
+
+    @staticmethod
+    def randomGene(routes: list[PotentialRoutes]) -> tuple[int, int]:
+        goIndex = random.randrange(len(routes))
+        return (goIndex, random.randrange(len(routes[goIndex].flightsBack)))
 
     def selectRoutes(self):
-        for traveller in self.travellers:
-            potentialRoute = random.choice(traveller.potentialRoutes)
-            route = Route(
-                flightToGo=potentialRoute.flightToGo,
-                flightBack=random.choice(potentialRoute.flightsBack),
-            )
-            route.cost = route.flightToGo.price_eur + route.flightBack.price_eur
-            traveller.selectedRoute = route
+        self.genome = [self.randomGene(routes) for routes in self.routeTables]
+
+    def selectedRoute(self, travellerIndex: int) -> Route:
+        goIndex, backIndex = self.genome[travellerIndex]
+        potentialRoute = self.routeTables[travellerIndex][goIndex]
+        flightBack = potentialRoute.flightsBack[backIndex]
+        return Route(
+            flightToGo=potentialRoute.flightToGo,
+            flightBack=flightBack,
+            cost=potentialRoute.flightToGo.price_eur + flightBack.price_eur
+        )
+
+    def selectedRoutes(self) -> list[Route]:
+        return [self.selectedRoute(i) for i in range(len(self.genome))]
+
+    def genomeKey(self) -> tuple:
+        """ Hashable genome: destination plus the selected flight ids of every traveller """
+        return (self.chosenDestination, tuple(
+            (route.flightToGo.id, route.flightBack.id) for route in self.selectedRoutes()
+        ))
 
     def deltaDays(self, daysSelected: int):
-        daysList = [traveller.selectedRoute.flightBack.departure_date - traveller.selectedRoute.flightToGo.departure_date for traveller in self.travellers]
+        daysList = [route.flightBack.departure_date - route.flightToGo.departure_date for route in self.selectedRoutes()]
         daysSelected_td = timedelta(days=daysSelected)
         return sum(abs(days - daysSelected_td).total_seconds() for days in daysList)
 
     def deltaTime(self, arrival: bool = True): # arrival or leaving
         deltas = []
         if arrival:
-            times = [traveller.selectedRoute.flightToGo.arrival_time_local for traveller in self.travellers]
+            times = [route.flightToGo.arrival_time_local for route in self.selectedRoutes()]
         else: # then, leaving
-            times = [traveller.selectedRoute.flightBack.departure_time_local for traveller in self.travellers]
+            times = [route.flightBack.departure_time_local for route in self.selectedRoutes()]
 
         times.sort()
         
@@ -143,21 +199,21 @@ class Trip:
         return sum(delta.total_seconds() for delta in deltas)
     
     def deltaBudget(self):
-        return sum(abs(traveller.budget - traveller.selectedRoute.cost) for traveller in self.travellers)
+        return sum(abs(traveller.budget - route.cost) for traveller, route in zip(self.travellers, self.selectedRoutes()))
     
     def calculateDeparturesSuitability(self) -> int:
         badDepartures = 0
-        for traveller in self.travellers:
-            if traveller.selectedRoute.flightToGo.departure_date.weekday() == 6:
+        for route in self.selectedRoutes():
+            if route.flightToGo.departure_date.weekday() == 6:
                 """ Starting trip on Sunday -> wasting weekend """
                 badDepartures+=1
-            if traveller.selectedRoute.flightBack.departure_date.weekday() in [4, 5]:
+            if route.flightBack.departure_date.weekday() in [4, 5]:
                 """ Coming back on Friday or Saturday -> wasting weekend """
                 badDepartures+=1
         return badDepartures
     
     def calculateNumStayovers(self) -> int:
-        return sum(traveller.selectedRoute.flightToGo.stayovers + traveller.selectedRoute.flightBack.stayovers for traveller in self.travellers)
+        return sum(route.flightToGo.stayovers + route.flightBack.stayovers for route in self.selectedRoutes())
 
 # Within preferred destinations
 # Arrival time close
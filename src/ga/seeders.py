@@ -0,0 +1,78 @@
+""" Seeders propose individuals for the initial population of a GeneticAlgorithm,
+so early generations refine sensible trips instead of recovering from random ones.
+GeneticAlgorithm(seeders=[...], seedFraction=0.2) asks them in order for that share of the population,
+the rest stays random for diversity """
+
+from src.ga.plan import PotentialRoutes, Trip
+from src.ga.cache import PlanResult
+from src.ga.exact import routeOptions
+from src.ga.evaluation import DELTA_TIME_PENALTY
+import numpy as np
+
+class Seeder:
+    def seed(self, gaEngine, count: int) -> list[Trip]:
+        """ Up to count individuals with their route tables and genome set, not evaluated yet """
+        raise NotImplementedError
+
+class DestinationSeeder(Seeder):
+    """ One candidate per feasible destination, the best scoring ones are kept """
+    def genome(self, gaEngine, routeTables: list[list[PotentialRoutes]]) -> list[tuple[int, int]]:
+        raise NotImplementedError
+
+    def seed(self, gaEngine, count: int) -> list[Trip]:
+        candidates = []
+        for destination in gaEngine.get_feasibility().feasibleDestinations:
+            individual = gaEngine.individual_for(destination)
+            if not individual.hasRoutes():
+                continue
+            individual.genome = self.genome(gaEngine, individual.routeTables)
+            candidates.append((gaEngine.evaluate_individual(individual)[0], individual))
+        candidates.sort(key=lambda candidate: candidate[0])
+        return [individual for _, individual in candidates[:count]]
+
+class CheapestSeeder(DestinationSeeder):
+    """ Every traveller on the cheapest round trip to the destination """
+    def genome(self, gaEngine, routeTables):
+        return [
+            min(
+                ((goIndex, backIndex) for goIndex, route in enumerate(routes) for backIndex in range(len(route.flightsBack))),
+                key=lambda gene: routes[gene[0]].flightToGo.price_eur + routes[gene[0]].flightsBack[gene[1]].price_eur
+            )
+            for routes in routeTables
+        ]
+
+class AlignedArrivalSeeder(DestinationSeeder):
+    """ Greedy: the median of the travellers' best options sets the arrival and departure times,
+    then every traveller takes the option with the best own score plus time distance to them """
+    def genome(self, gaEngine, routeTables):
+        numTravellers = len(routeTables)
+        options = [
+            routeOptions(routes, traveller, gaEngine.travelPlan.days, numTravellers)
+            for routes, traveller in zip(routeTables, gaEngine.travellersTemplate)
+        ]
+        arrival = np.median([option.arrivals[0] for option in options])
+        departure = np.median([option.departures[0] for option in options])
+        timePenalty = DELTA_TIME_PENALTY / (3600 * 24 * numTravellers)
+
+        genome = []
+        for option in options:
+            distance = np.abs(option.arrivals - arrival) + np.abs(option.departures - departure)
+            goIndex, backIndex = option.genes[int(np.argmin(option.scores + timePenalty * distance))]
+            genome.append((int(goIndex), int(backIndex)))
+        return genome
+
+class PreviousSolutionsSeeder(Seeder):
+    """ Trips found for similar plans (see PlanCache.similar), where their flights still apply """
+    def __init__(self, results: list[PlanResult]):
+        self.results = results
+
+    def seed(self, gaEngine, count: int) -> list[Trip]:
+        individuals = []
+        for result in self.results:
+            if len(individuals) == count:
+                break
+            flightIds = result.assign(gaEngine.travellersTemplate)
+            individual = gaEngine.seed_individual(result.destination, flightIds) if flightIds else None
+            if individual:
+                individuals.append(individual)
+        return individuals
@@ -0,0 +1,57 @@
+""" Termination criteria for GeneticAlgorithm.run, checked after every generation """
+
+import time
+
+class StoppingCriteria:
+    def __init__(
+            self,
+            stagnationGenerations: int = None,
+            targetFitness: float = None,
+            timeBudget: float = None,
+            minDiversity: float = None,
+            minImprovement: float = 1e-9
+        ):
+        """ stagnationGenerations: stop when the best fitness has not improved for that many generations
+        targetFitness: stop once the best fitness is at or below it (fitness is minimized)
+        timeBudget: wall-clock seconds for the whole run, population creation included
+        minDiversity: stop when the share of distinct genomes in the population falls below it """
+        self.stagnationGenerations = stagnationGenerations
+        self.targetFitness = targetFitness
+        self.timeBudget = timeBudget
+        self.minDiversity = minDiversity
+        self.minImprovement = minImprovement
+        self.start()
+
+    def start(self):
+        self.startedAt = time.perf_counter()
+        self.bestFitness = float("inf")
+        self.stagnantGenerations = 0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.startedAt
+
+    @staticmethod
+    def diversity(population: list) -> float:
+        if not population:
+            return 0.0
+        return len({individual.genomeKey() for individual in population}) / len(population)
+
+    def check(self, bestFitness: float, population: list):
+        """ Reason to stop, or None to keep evolving """
+        if bestFitness < self.bestFitness - self.minImprovement:
+            self.bestFitness = bestFitness
+            self.stagnantGenerations = 0
+        else:
+            self.stagnantGenerations += 1
+
+        if self.targetFitness is not None and bestFitness <= self.targetFitness:
+            return f"target fitness {self.targetFitness} reached"
+        if self.stagnationGenerations is not None and self.stagnantGenerations >= self.stagnationGenerations:
+            return f"no improvement in the last {self.stagnantGenerations} generations"
+        if self.timeBudget is not None and self.elapsed() >= self.timeBudget:
+            return f"time budget of {self.timeBudget}s used"
+        if self.minDiversity is not None:
+            diversity = self.diversity(population)
+            if diversity < self.minDiversity:
+                return f"population diversity collapsed to {diversity:.2f}"
+        return None
@@ -0,0 +1,179 @@
+""" Process-wide counters, gauges and histograms, rendered in the Prometheus text format by /metrics.
+An update is a lock and a couple of additions, cheap enough for the GA's inner loops.
+Metrics recorded inside worker processes (parallel GA pools, islands) stay in those processes """
+
+from bisect import bisect_left
+from functools import wraps
+import threading
+import time
+
+# seconds, from a columnar lookup to a slow LLM answer
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {} # label values -> value
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelNames)
+
+    def _labels(self, key: tuple, extra: dict = None) -> str:
+        pairs = list(zip(self.labelNames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            return [f"{self.name}{self._labels(key)} {value}" for key, value in self.values.items()]
+
+    def exposition(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples())
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        if not self.labelNames:
+            self.values[()] = 0 # exposed from the start, rate() needs the zero before the first increment
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def labels(self, **labels) -> "BoundCounter":
+        """ Counter with the label values resolved once, for hot paths """
+        return BoundCounter(self, self._key(labels))
+
+class BoundCounter:
+    def __init__(self, counter: Counter, key: tuple):
+        self.counter = counter
+        self.key = key
+        with counter.lock:
+            counter.values.setdefault(key, 0)
+
+    def inc(self, amount: float = 1):
+        with self.counter.lock:
+            self.counter.values[self.key] += amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        if not self.labelNames:
+            self.values[()] = 0
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0] # per bucket counts, sum, count
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> "Timer":
+        """ with histogram.time(...): observes the seconds spent in the block """
+        return Timer(self, labels)
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucketCount in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucketCount
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{self._labels(key, {'le': le})} {cumulative}")
+                lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+                lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+class Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+def timed(histogram: Histogram, **labels):
+    """ Decorator: observes the duration of every call """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, cls, name: str, help: str, **options):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, **options)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter, name, help, labels=labels)
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge, name, help, labels=labels)
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labels=labels, buckets=buckets)
+
+    def exposition(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.exposition() for metric in metrics) + "\n"
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+# shared by every LRU-style cache of the project, labelled with the cache name
+CACHE_LOOKUPS = counter("cache_lookups_total", "Cache lookups by cache and result (hit, similar or miss)", labels=("cache", "result"))
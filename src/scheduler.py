@@ -0,0 +1,151 @@
+""" Admission control for planning runs.
+The scheduler hands out `workers` cores. A run holds as many as the processes it keeps busy: 1 for a
+GA run in a thread (threads share the GIL, more of them only split the same core), one per island
+for the island model. Runs start on a dedicated thread pool, further requests wait in a bounded
+priority queue (FIFO within a priority) and see their position while they wait.
+When the queue is full, new requests are rejected right away instead of slowing everyone down """
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import itertools
+import asyncio
+import heapq
+import time
+import os
+from src import metrics
+
+WAIT_SECONDS = metrics.histogram("planner_wait_seconds", "Time a planning request waited for a worker")
+QUEUE_DEPTH = metrics.gauge("planner_queue_depth", "Planning requests waiting for a worker")
+RUNNING = metrics.gauge("planner_running", "Planning runs in progress")
+REJECTED = metrics.counter("planner_rejected_total", "Planning requests turned away with the queue full")
+
+class SchedulerBusy(Exception):
+    pass
+
+class Ticket:
+    """ A request's place in the scheduler: waiting, then holding a worker until released """
+    def __init__(self, scheduler: "PlanningScheduler", priority: int, sequence: int, weight: int = 1):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.sequence = sequence
+        self.weight = weight # cores held while running
+        self.submitted = time.monotonic()
+        self.started = None
+        self.granted = False
+        self.released = False
+        self.changed = asyncio.Event() # queue moved or worker granted
+
+    async def waitTurn(self):
+        """ Yields the 1-based queue position every time it changes, ends once a worker is assigned
+        (or the ticket is released while waiting) """
+        lastPosition = None
+        while True:
+            self.changed.clear()
+            if self.granted or self.released:
+                return
+            position = self.scheduler.position(self)
+            if position != lastPosition:
+                lastPosition = position
+                yield position
+            if not self.changed.is_set(): # it may have moved while the position was being sent
+                await self.changed.wait()
+
+    def release(self):
+        self.scheduler.release(self)
+
+class PlanningScheduler:
+    def __init__(self, workers: int = 1, maxQueued: int = 32, historySize: int = 1000):
+        """ workers: cores the runs may keep busy at once, os.cpu_count() for None """
+        self.workers = workers or os.cpu_count() or 1
+        self.maxQueued = maxQueued
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="planner")
+
+        self.running = 0
+        self.busy = 0 # cores held by the running tickets
+        self.waiting = [] # heap of (priority, sequence, ticket)
+        self.sequence = itertools.count()
+
+        # metrics
+        self.waits = deque(maxlen=historySize) # seconds between submit and start of the last runs
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.abandoned = 0 # left the queue before starting, e.g. disconnected
+
+    def submit(self, priority: int = 0, weight: int = 1) -> Ticket:
+        """ Lower priority values go first. weight: cores the run keeps busy, at most workers.
+        Raises SchedulerBusy when the queue is full """
+        weight = max(1, min(weight, self.workers))
+        if not self._fits(weight) and len(self.waiting) >= self.maxQueued:
+            self.rejected += 1
+            REJECTED.inc()
+            raise SchedulerBusy(f"{self.running} plans running and {len(self.waiting)} waiting")
+
+        ticket = Ticket(self, priority, next(self.sequence), weight)
+        self.submitted += 1
+        if self._fits(weight) and not self.waiting:
+            self._grant(ticket)
+        else:
+            heapq.heappush(self.waiting, (priority, ticket.sequence, ticket))
+            self._notify()
+        return ticket
+
+    def _fits(self, weight: int) -> bool:
+        return self.busy + weight <= self.workers
+
+    def _grant(self, ticket: Ticket):
+        self.running += 1
+        self.busy += ticket.weight
+        RUNNING.set(self.running)
+        ticket.granted = True
+        ticket.started = time.monotonic()
+        self.waits.append(ticket.started - ticket.submitted)
+        WAIT_SECONDS.observe(ticket.started - ticket.submitted)
+        ticket.changed.set()
+
+    def release(self, ticket: Ticket):
+        """ Frees the worker, or the queue slot of a ticket still waiting. Safe to call twice """
+        if ticket.released:
+            return
+        ticket.released = True
+
+        if ticket.granted:
+            self.running -= 1
+            self.busy -= ticket.weight
+            self.completed += 1
+        else:
+            self.waiting = [entry for entry in self.waiting if entry[2] is not ticket]
+            heapq.heapify(self.waiting)
+            self.abandoned += 1
+            ticket.changed.set() # ends its waitTurn
+        # in queue order: a heavy run at the head is not overtaken by lighter ones behind it
+        while self.waiting and self._fits(self.waiting[0][2].weight):
+            self._grant(heapq.heappop(self.waiting)[2])
+        self._notify()
+
+    def position(self, ticket: Ticket) -> int:
+        key = (ticket.priority, ticket.sequence)
+        return 1 + sum(1 for priority, sequence, _ in self.waiting if (priority, sequence) < key)
+
+    def _notify(self):
+        QUEUE_DEPTH.set(len(self.waiting))
+        RUNNING.set(self.running)
+        for _, _, ticket in self.waiting:
+            ticket.changed.set()
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "busyWorkers": self.busy,
+            "queueDepth": len(self.waiting),
+            "maxQueued": self.maxQueued,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "abandoned": self.abandoned,
+            "waitMean": sum(waits) / len(waits) if waits else 0.0,
+            "waitP95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+            "waitMax": waits[-1] if waits else 0.0
+        }
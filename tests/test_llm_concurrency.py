@@ -0,0 +1,172 @@
+""" The server keeps answering while slow LLM calls are in flight: the blocking Bedrock client runs
+on the LLM executor, never on the event loop. Streamed answers reach the client from their first chunk
+and a plan is parsed as soon as it is complete. Runs the app on a temporary directory with a stubbed client """
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from fastapi.testclient import TestClient
+from pathlib import Path
+import importlib
+import threading
+import asyncio
+import pytest
+import json
+import time
+import sys
+
+ANSWER = "I can only help you plan trips between cities, tell me who travels and from where."
+CHUNK = 8
+CHUNK_DELAY = 0.1 # a bit over a second per answer
+CLIENTS = 4 # LLM maxConcurrency
+PLAN = {
+    "listTravellers": [{"origin": "Malaga", "budget": 500}, {"origin": "Valencia", "budget": 600}],
+    "travelPlan": {"fromDate": "2026-11-01", "toDate": "2026-11-30", "priceMax": 700, "days": 5, "allowStayover": True,
+                   "availableDestinations": ["Paris", "Rome"], "notes": "no {red-eye} flights"}
+}
+# the model adds text after the plan: it is parsed at its closing brace, not at the end of the stream
+PLAN_ANSWER = "```json\n" + json.dumps(PLAN) + "\n```\nEnjoy the trip, and tell me if anything needs changing!"
+ROOT = Path(__file__).resolve().parents[1]
+
+class SlowStreamingClient:
+    """ Stands in for the bedrock-runtime client: blocks between the chunks like a real stream """
+    def __init__(self, answer: str = ANSWER, delay: float = CHUNK_DELAY):
+        self.answer = answer
+        self.delay = delay
+        self.open = 0 # streams still being read
+        self.finished = None # perf_counter at the end of the last stream
+        self.lock = threading.Lock()
+
+    def invoke_model_with_response_stream(self, **request):
+        def events():
+            with self.lock:
+                self.open += 1
+            try:
+                for i in range(0, len(self.answer), CHUNK):
+                    time.sleep(self.delay)
+                    delta = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": self.answer[i:i + CHUNK]}}
+                    yield {"chunk": {"bytes": json.dumps(delta).encode()}}
+            finally:
+                with self.lock:
+                    self.open -= 1
+                    self.finished = time.perf_counter()
+        return {"body": events()}
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # the app creates its database next to it
+    monkeypatch.setenv("AWS_REGION", "eu-west-1")
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "llm_cache.json"))
+    monkeypatch.syspath_prepend(str(ROOT))
+    sys.modules.pop("app", None)
+    app = importlib.import_module("app")
+    app.llm.client = SlowStreamingClient()
+    app.llm.cache = None
+    with TestClient(app.app) as client: # one event loop shared by every request
+        client.app_module = app
+        yield client
+
+def planTrip(client: TestClient) -> tuple[str, float]:
+    t0 = time.perf_counter()
+    with client.websocket_connect("/ws/plan-trip") as websocket:
+        websocket.send_text(json.dumps({"userQuery": "What is the weather like?"}))
+        text = ""
+        while True:
+            try:
+                message = websocket.receive_text()
+            except Exception: # closed by the server
+                break
+            text += message.removeprefix("[PARTIAL]")
+    return text, time.perf_counter() - t0
+
+def test_single_request(client):
+    text, seconds = planTrip(client)
+    assert text == ANSWER # streamed once, not repeated at the end
+    assert seconds >= CHUNK_DELAY * (len(ANSWER) // CHUNK)
+
+def test_concurrent_requests_keep_throughput(client):
+    single = planTrip(client)[1]
+
+    with ThreadPoolExecutor(max_workers=CLIENTS) as pool:
+        t0 = time.perf_counter()
+        requests = [pool.submit(planTrip, client) for _ in range(CLIENTS)]
+
+        # HTTP endpoints stay responsive while every LLM slot is busy
+        time.sleep(single / 3)
+        latencies = []
+        for _ in range(5):
+            start = time.perf_counter()
+            assert client.get("/scheduler").status_code == 200
+            latencies.append(time.perf_counter() - start)
+        results = [request.result() for request in requests]
+        elapsed = time.perf_counter() - t0
+
+    assert all(text == ANSWER for text, _ in results)
+    assert max(latencies) < CHUNK_DELAY * 2
+    # served side by side: nowhere near one after the other
+    assert elapsed < single * 2
+
+def test_timed_out_streams_free_their_thread(monkeypatch):
+    monkeypatch.syspath_prepend(str(ROOT))
+    from src.ai_agent.llm import LLM
+
+    stub = SlowStreamingClient(delay=0.4) # over four seconds per answer
+    llm = LLM("model", client=stub, maxConcurrency=2, timeout=0.3)
+
+    async def firstChunk() -> float:
+        t0 = time.perf_counter()
+        async with aclosing(llm.astreamInvoke("system", "user")) as stream:
+            async for _ in stream:
+                return time.perf_counter() - t0
+
+    async def scenario():
+        calls = [firstChunk(), firstChunk()]
+        for result in await asyncio.gather(*calls, return_exceptions=True):
+            assert isinstance(result, asyncio.TimeoutError)
+        assert stub.open == 0 # the streams were closed, not left running on the executor
+        llm.timeout = 5
+        seconds = await firstChunk() # and this one is abandoned after its first chunk
+        assert stub.open == 0
+        return seconds
+
+    # the slots and the executor threads are free again: no waiting for the dead streams
+    assert asyncio.run(scenario()) < 0.4 * 2
+
+def test_streamed_plan_is_parsed_at_its_closing_brace(monkeypatch):
+    monkeypatch.syspath_prepend(str(ROOT))
+    from src.ai_agent.llm import LLM
+
+    stub = SlowStreamingClient(PLAN_ANSWER, delay=0.05)
+    llm = LLM("model", client=stub)
+
+    async def stream():
+        t0 = time.perf_counter()
+        firstText = trip = None
+        async for kind, payload in llm.astreamTrip("system", "user"):
+            if kind == "text" and firstText is None:
+                firstText = time.perf_counter()
+            elif kind == "trip":
+                trip = (time.perf_counter(), payload)
+        return t0, firstText, trip
+
+    t0, firstText, (parsedAt, plan) = asyncio.run(stream())
+    assert plan == PLAN
+    assert firstText - t0 < 0.05 * 3 # first delta forwarded right away
+    remaining = len(PLAN_ANSWER) - PLAN_ANSWER.rindex("}") - 1
+    assert stub.finished - parsedAt > 0.05 * (remaining // CHUNK - 1) # well before the last chunk
+
+def test_first_partial_frame_before_the_stream_ends(client):
+    stub = client.app_module.llm.client = SlowStreamingClient(PLAN_ANSWER, delay=0.05)
+    with client.websocket_connect("/ws/plan-trip") as websocket:
+        websocket.send_text(json.dumps({"userQuery": "Two friends from Malaga and Valencia"}))
+        first = websocket.receive_text()
+        firstAt = time.perf_counter()
+        frames = [first]
+        while True:
+            try:
+                frames.append(websocket.receive_text())
+            except Exception:
+                break
+
+    assert first.startswith("[PARTIAL]")
+    assert stub.finished - firstAt > 0.05 * 10 # time to first byte: one chunk, not the whole answer
+    assert "".join(frame.removeprefix("[PARTIAL]") for frame in frames if frame.startswith("[PARTIAL]")).startswith("```json")